@@ -1,2 +1,38 @@
+import argparse
+import json
+import logging
+
+
 def main() -> None:
-    print("Hello from eodata-gateway!")
+    parser = argparse.ArgumentParser(prog='eodata-gateway')
+    parser.add_argument('--url', default='http://127.0.0.1:8765', help='Gateway service URL')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='Run the warm gateway service')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+
+    for command in ('search', 'count'):
+        command_parser = subparsers.add_parser(command, help=f'{command.capitalize()} products through the service')
+        command_parser.add_argument('product_type', help="eodag product type, e.g. 'S2_MSI_L2A'")
+        command_parser.add_argument('start', help='Start date, ISO 8601')
+        command_parser.add_argument('end', help='End date, ISO 8601')
+        command_parser.add_argument('--bbox', type=float, nargs=4, metavar=('LONMIN', 'LATMIN', 'LONMAX', 'LATMAX'))
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        from eodata_gateway.daemon import serve
+
+        logging.basicConfig(level=logging.INFO)
+        serve(args.host, args.port)
+        return
+
+    from eodata_gateway.daemon import GatewayClient
+
+    client = GatewayClient(args.url)
+    if args.command == 'search':
+        products = client.search(productType=args.product_type, start=args.start, end=args.end, geom=args.bbox)
+        print(json.dumps(products.as_geojson_object(), indent=2, default=str))
+    else:
+        print(client.count(productType=args.product_type, start=args.start, end=args.end, geom=args.bbox))
@@ -0,0 +1,173 @@
+"""
+Local chunked temporal compositing over downloaded products for eodata-gateway
+
+Computes per-pixel temporal mean/median/max over a stack of co-registered
+rasters, tile by tile, in a process pool. Inputs are memory-mapped ``.npy``
+arrays or, when rasterio is installed, any raster it can read with windows.
+The composite is written into a memory-mapped ``.npy`` array shared by the
+workers, each of them writing disjoint tiles.
+
+Mean and max are accumulated one raster at a time, so a worker only holds a
+few tile-sized arrays whatever the stack depth. Median needs the whole stack
+of a tile: tiles are shrunk so that stack fits in ``max_tile_bytes``.
+Tiles are submitted in a window of a few per worker, so the number of
+pending tasks stays bounded however small the tiles get.
+"""
+import logging
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:  # only .npy sources without rasterio
+    rasterio = None
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('mean', 'median', 'max')
+
+DEFAULT_TILE_SIZE = 512
+DEFAULT_MAX_TILE_BYTES = 256 * 1024 ** 2
+# Tiles submitted ahead of the workers, per worker
+_TILES_PER_WORKER = 2
+
+
+def _is_npy(path):
+    return str(path).endswith('.npy')
+
+
+def source_shape(path):
+    """
+    Get the shape of a source raster as (bands, rows, cols)
+
+    Args:
+        path (str): Path of a .npy array or of a raster readable by rasterio
+
+    Returns:
+        tuple: Number of bands, rows and columns
+    """
+    if _is_npy(path):
+        shape = np.load(path, mmap_mode='r').shape
+        return (1,) + shape if len(shape) == 2 else shape
+    if rasterio is None:
+        raise ImportError(f"rasterio is required to read {path}")
+    with rasterio.open(path) as src:
+        return src.count, src.height, src.width
+
+
+def _read_tile(path, row, col, height, width, nodata):
+    """Read a tile of a source as float32, with nodata values set to NaN"""
+    if _is_npy(path):
+        array = np.load(path, mmap_mode='r')
+        if array.ndim == 2:
+            array = array[np.newaxis]
+        tile = np.array(array[:, row:row + height, col:col + width], dtype=np.float32)
+    else:
+        with rasterio.open(path) as src:
+            tile = src.read(window=Window(col, row, width, height)).astype(np.float32)
+            if nodata is None:
+                nodata = src.nodata
+    if nodata is not None:
+        tile[tile == nodata] = np.nan
+    return tile
+
+
+def _composite_tile(sources, output_path, method, row, col, height, width, nodata):
+    """Compute one output tile and write it into the output memmap"""
+    if method == 'median':
+        stack = np.stack([_read_tile(path, row, col, height, width, nodata) for path in sources])
+        result = np.nanmedian(stack, axis=0)
+    else:
+        accumulator = None
+        count = None
+        for path in sources:
+            tile = _read_tile(path, row, col, height, width, nodata)
+            valid = ~np.isnan(tile)
+            if accumulator is None:
+                accumulator = np.full(tile.shape, 0 if method == 'mean' else -np.inf, dtype=np.float64)
+                count = np.zeros(tile.shape, dtype=np.uint32)
+            if method == 'mean':
+                accumulator += np.where(valid, tile, 0)
+            else:
+                np.fmax(accumulator, tile, out=accumulator)
+            count += valid
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = accumulator / count if method == 'mean' else accumulator
+        result[count == 0] = np.nan
+
+    output = np.load(output_path, mmap_mode='r+')
+    output[:, row:row + height, col:col + width] = result
+    output.flush()
+    return row, col
+
+
+def _tile_size(tile_size, method, depth, bands, max_tile_bytes):
+    """Shrink tiles so a median stack fits in max_tile_bytes"""
+    if method != 'median':
+        return tile_size
+    max_pixels = max_tile_bytes // (depth * bands * np.dtype(np.float32).itemsize)
+    return max(1, min(tile_size, math.isqrt(max_pixels)))
+
+
+def composite(sources, output_path, method='mean', tile_size=DEFAULT_TILE_SIZE,
+              max_workers=None, nodata=None, max_tile_bytes=DEFAULT_MAX_TILE_BYTES):
+    """
+    Compute a temporal composite of co-registered rasters
+
+    Args:
+        sources (list): Paths of the rasters to composite (.npy or rasterio-readable),
+            all with the same shape
+        output_path (str): Path of the output .npy array, of shape (bands, rows, cols)
+        method (str): One of 'mean', 'median' or 'max'
+        tile_size (int): Side of the square tiles processed by the workers
+        max_workers (int, optional): Number of worker processes, all cores if None
+        nodata (float, optional): Value ignored in sources, in addition to NaN.
+            Defaults to the nodata value of rasterio sources.
+        max_tile_bytes (int): Memory budget of a median tile stack
+
+    Returns:
+        numpy.memmap: The composite, memory-mapped read-only
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unsupported composite method {method}, expected one of {METHODS}")
+    if not sources:
+        raise ValueError("No source to composite")
+
+    shape = source_shape(sources[0])
+    for path in sources[1:]:
+        if source_shape(path) != shape:
+            raise ValueError(f"{path} is not co-registered with {sources[0]}: {source_shape(path)} != {shape}")
+    bands, rows, cols = shape
+
+    output_path = str(output_path)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    output = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float32, shape=shape)
+    del output
+
+    size = _tile_size(tile_size, method, len(sources), bands, max_tile_bytes)
+    tiles = (
+        (row, col, min(size, rows - row), min(size, cols - col))
+        for row in range(0, rows, size)
+        for col in range(0, cols, size)
+    )
+    count = math.ceil(rows / size) * math.ceil(cols / size)
+    logger.info(f"Compositing {len(sources)} rasters ({method}) in {count} tiles of {size}px")
+
+    sources = list(sources)
+    window = _TILES_PER_WORKER * (max_workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for row, col, height, width in tiles:
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(executor.submit(_composite_tile, sources, output_path, method, row, col, height, width, nodata))
+        for future in pending:
+            future.result()
+
+    return np.load(output_path, mmap_mode='r')
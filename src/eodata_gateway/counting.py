@@ -0,0 +1,207 @@
+"""
+Count-only catalogue queries for harvest planning in eodata-gateway
+
+Result sizes are read from the resto ``totalResults`` field (the
+``total_items_nb_key_path`` of the provider configuration) of requests
+asking for a single record, so counting transfers almost nothing. Requests
+are sent straight to the OpenSearch endpoint of the provider configuration
+rather than through ``dag.search``, whose search plugins keep per-search
+state and cannot be shared between threads.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import requests
+from eodag.utils import get_geometry_from_various
+from jsonpath_ng import parse as parse_jsonpath
+from requests.adapters import HTTPAdapter
+
+from eodata_gateway.config.utils import load_opensearch_provider_config
+from eodata_gateway.gateway import DEFAULT_PROVIDER
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_TIMEOUT = 60
+
+# resto query parameters selecting the products of one grid tile, per collection
+TILE_PARAMETERS = {
+    'SENTINEL-2': 'tileId',
+}
+
+
+def month_bins(start, end):
+    """
+    Split a time window into calendar months
+
+    Args:
+        start (str): Start of the window, ISO 8601 date
+        end (str): End of the window (excluded), ISO 8601 date
+
+    Returns:
+        list: (bin_start, bin_end) ISO date pairs
+    """
+    current = date.fromisoformat(str(start)[:10]).replace(day=1)
+    start, end = date.fromisoformat(str(start)[:10]), date.fromisoformat(str(end)[:10])
+    bins = []
+    while current < end:
+        following = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+        bins.append((max(current, start).isoformat(), min(following, end).isoformat()))
+        current = following
+    return bins
+
+
+def _bin_window(bin_start, bin_end):
+    """
+    Query bounds of a month bin
+
+    resto includes the completionDate bound and may widen a date-only bound
+    to the end of that day, so the bin end is sent as the last millisecond
+    before it, keeping adjacent bins disjoint.
+    """
+    last = datetime.fromisoformat(bin_end) - timedelta(milliseconds=1)
+    return f"{bin_start}T00:00:00.000Z", f"{last.isoformat(timespec='milliseconds')}Z"
+
+
+class ProductCounter:
+    """
+    Count catalogue products with minimal OpenSearch requests
+
+    Args:
+        provider (str): Provider of the OpenSearch provider configuration to use
+        config_path (str, optional): Path to the provider configuration file
+        max_workers (int): Number of concurrent count requests
+        timeout (int): Request timeout in seconds
+    """
+
+    def __init__(self, provider=DEFAULT_PROVIDER, config_path=None,
+                 max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT):
+        config = load_opensearch_provider_config(config_path)[provider]
+        self.api_endpoint = config['search']['api_endpoint']
+        self.products = config['products']
+        self.total_path = parse_jsonpath(config['search']['pagination']['total_items_nb_key_path'])
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def count(self, productType, start, end, geom=None, **kwargs):
+        """
+        Count the products matching a search
+
+        Args:
+            productType (str): eodag product type, e.g. 'S2_MSI_L2A'
+            start (str): Start of the time window, ISO 8601
+            end (str): End of the time window, ISO 8601
+            geom (optional): Search area, in any form accepted by ``dag.search()``
+            **kwargs: Additional resto query parameters, e.g. cloudCover='[0,20]'
+
+        Returns:
+            int: Number of matching products
+        """
+        product = self.products[productType]
+        params = {
+            'maxRecords': 1,
+            'exactCount': 1,
+            'productType': product['productType'],
+            'startDate': start.isoformat() if isinstance(start, (date, datetime)) else start,
+            'completionDate': end.isoformat() if isinstance(end, (date, datetime)) else end,
+            **kwargs,
+        }
+        if geom is not None:
+            params['geometry'] = get_geometry_from_various(geometry=geom).wkt
+        response = self.session.get(
+            self.api_endpoint.format(collection=product['collection']),
+            params=params,
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        matches = self.total_path.find(response.json())
+        return int(matches[0].value) if matches and matches[0].value is not None else 0
+
+    def tile_parameter(self, productType):
+        """
+        Get the query parameter filtering a product type on its grid tile
+
+        Args:
+            productType (str): eodag product type
+
+        Returns:
+            str: resto parameter name, or None for product types without tiles
+        """
+        return TILE_PARAMETERS.get(self.products[productType]['collection'])
+
+    def _tile_criteria(self, product_type, tile, geometry):
+        """Query criteria selecting the products of a tile"""
+        if tile is None:
+            return {}
+        parameter = self.tile_parameter(product_type)
+        if parameter is not None:
+            # MGRS tiles are often written with a leading T, e.g. T31TCJ
+            return {parameter: tile[1:] if len(tile) == 6 and tile[0] == 'T' else tile}
+        if geometry is None:
+            raise ValueError(f"{product_type} products are not tiled, tile geometries are needed")
+        return {'geom': geometry}
+
+    def histogram(self, product_types, start, end, tiles=None, **kwargs):
+        """
+        Count products per product type, month and tile concurrently
+
+        Tiled product types (Sentinel-2) are filtered on their tile identifier,
+        so each product is counted in its own tile only. Footprints of
+        neighbouring tiles overlap, so filtering those on tile geometries would
+        count products several times. Other product types are filtered on the
+        tile geometries.
+
+        Args:
+            product_types (list): eodag product types
+            start (str): Start of the time window, ISO 8601 date
+            end (str): End of the time window (excluded), ISO 8601 date
+            tiles (list or dict, optional): Tile names, e.g. MGRS tiles such as
+                '31TCJ', or tile names mapped to their geometry, in any form
+                accepted by ``dag.search()``, for non-tiled product types.
+                Whole catalogue if None.
+            **kwargs: Additional resto query parameters
+
+        Returns:
+            dict: (product type, month start, tile name) mapped to the number of
+                products, or None where the count request failed
+
+        Raises:
+            ValueError: If a non-tiled product type is given tiles without geometries
+        """
+        if tiles is None:
+            tiles = {None: None}
+        elif not isinstance(tiles, dict):
+            tiles = dict.fromkeys(tiles)
+        criteria = {
+            (product_type, tile): self._tile_criteria(product_type, tile, geometry)
+            for product_type in product_types
+            for tile, geometry in tiles.items()
+        }
+        cells = [
+            (product_type, bin_start, bin_end, tile)
+            for product_type in product_types
+            for bin_start, bin_end in month_bins(start, end)
+            for tile in tiles
+        ]
+
+        def count_cell(cell):
+            product_type, bin_start, bin_end, tile = cell
+            try:
+                return self.count(
+                    product_type, *_bin_window(bin_start, bin_end), **criteria[(product_type, tile)], **kwargs
+                )
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"Count failed for {product_type} {bin_start} {tile}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            counts = executor.map(count_cell, cells)
+            return {
+                (product_type, bin_start, tile): count
+                for (product_type, bin_start, _, tile), count in zip(cells, counts)
+            }
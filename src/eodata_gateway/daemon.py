@@ -0,0 +1,261 @@
+"""
+Warm local gateway service for eodata-gateway
+
+A long-running process keeps one configured EODataAccessGateway (provider
+configs, tokens, HTTP pools) and serves searches and counts to many client
+processes over localhost HTTP, so short-lived scripts and cron jobs skip the
+gateway setup. Identical concurrent requests from different clients are
+coalesced into a single upstream call, and recent answers are kept for a
+short time.
+
+Endpoints (JSON bodies):
+    GET  /health   -> {"status": "ok"}
+    POST /search   search criteria of ``dag.search()`` -> GeoJSON FeatureCollection
+    POST /count    criteria of ``ProductCounter.count()`` -> {"count": n}
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from eodag.api.search_result import SearchResult
+
+from eodata_gateway.counting import ProductCounter
+from eodata_gateway.gateway import create_gateway
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_TTL = 60
+DEFAULT_TIMEOUT = 600
+
+
+class RequestCoalescer:
+    """
+    Share one computation between identical concurrent requests
+
+    The first caller of a key computes the result; callers arriving while it
+    runs wait for the same result. Results are then kept for ``ttl`` seconds,
+    and expired results are dropped on every call.
+
+    Args:
+        ttl (float): Seconds a result is reused after completion
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def _prune(self, now):
+        """Drop expired results, must be called with the lock held"""
+        for key in [key for key, (_, expires) in self._futures.items() if expires is not None and expires <= now]:
+            del self._futures[key]
+
+    def run(self, key, function):
+        """
+        Get the result of function for a key, computing it at most once at a time
+
+        Args:
+            key (str): Canonical request key
+            function (callable): Computation without arguments
+
+        Returns:
+            object: Result of function
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            entry = self._futures.get(key)
+            if entry is not None:
+                future, owner = entry[0], False
+            else:
+                future, owner = Future(), True
+                self._futures[key] = (future, None)
+
+        if owner:
+            try:
+                future.set_result(function())
+            except Exception as e:
+                future.set_exception(e)
+            with self._lock:
+                if future.exception() is None and self.ttl > 0:
+                    self._futures[key] = (future, time.monotonic() + self.ttl)
+                else:
+                    self._futures.pop(key, None)
+        return future.result()
+
+
+class GatewayService:
+    """
+    Warm gateway state shared by all client requests
+
+    Args:
+        dag (EODataAccessGateway, optional): Gateway to serve, created with
+            create_gateway() if None
+        counter (ProductCounter, optional): Counter to serve
+        ttl (float): Seconds identical requests reuse a result
+    """
+
+    def __init__(self, dag=None, counter=None, ttl=DEFAULT_TTL):
+        self.dag = dag or create_gateway()
+        self.counter = counter or ProductCounter()
+        self.coalescer = RequestCoalescer(ttl)
+        # eodag search plugins keep per-search state, so upstream searches run
+        # one at a time per provider
+        self._locks_lock = threading.Lock()
+        self._search_locks = {}
+
+    def _search_lock(self, provider):
+        with self._locks_lock:
+            return self._search_locks.setdefault(provider, threading.Lock())
+
+    def _search(self, criteria):
+        # An explicit provider disables eodag fallback to other providers'
+        # plugins, which the lock of this provider does not cover
+        criteria = dict(criteria, provider=criteria.get('provider') or self.dag.get_preferred_provider()[0])
+        with self._search_lock(criteria['provider']):
+            return self.dag.search(**criteria).as_geojson_object()
+
+    def search(self, criteria):
+        """
+        Search products, coalescing identical concurrent searches
+
+        Args:
+            criteria (dict): Keyword arguments of ``dag.search()``
+
+        Returns:
+            dict: GeoJSON FeatureCollection of the products
+        """
+        key = 'search:' + json.dumps(criteria, sort_keys=True)
+        return self.coalescer.run(key, lambda: self._search(criteria))
+
+    def count(self, criteria):
+        """
+        Count products, coalescing identical concurrent counts
+
+        Args:
+            criteria (dict): Keyword arguments of ``ProductCounter.count()``
+
+        Returns:
+            dict: {'count': number of matching products}
+        """
+        key = 'count:' + json.dumps(criteria, sort_keys=True)
+        return {'count': self.coalescer.run(key, lambda: self.counter.count(**criteria))}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        routes = {'/search': self.service.search, '/count': self.service.count}
+        if self.path not in routes:
+            self._send_json(404, {'error': f"Unknown endpoint {self.path}"})
+            return
+        try:
+            criteria = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            self._send_json(200, routes[self.path](criteria))
+        except Exception as e:
+            logger.exception(f"{self.path} failed")
+            self._send_json(500, {'error': f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, service=None):
+    """
+    Run the gateway service until interrupted
+
+    Args:
+        host (str): Address to bind, localhost by default
+        port (int): Port to bind
+        service (GatewayService, optional): Service to expose, created if None
+    """
+    handler = type('Handler', (_Handler,), {'service': service or GatewayService()})
+    server = ThreadingHTTPServer((host, port), handler)
+    logger.info(f"eodata-gateway service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class GatewayClient:
+    """
+    Thin client of a running gateway service
+
+    Args:
+        url (str): Base URL of the service
+        timeout (int): Request timeout in seconds
+    """
+
+    def __init__(self, url=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout=DEFAULT_TIMEOUT):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _post(self, endpoint, criteria):
+        response = self.session.post(f"{self.url}{endpoint}", json=criteria, timeout=self.timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"Gateway service error: {response.json().get('error', response.text)}")
+        return response.json()
+
+    def is_alive(self):
+        """
+        Check whether the service is running
+
+        Returns:
+            bool: True if the service answered
+        """
+        try:
+            return self.session.get(f"{self.url}/health", timeout=5).ok
+        except requests.ConnectionError:
+            return False
+
+    def search(self, **criteria):
+        """
+        Search products through the service
+
+        Returned products are not registered with a downloader; download them
+        with a local gateway or enqueue them in a DownloadQueue.
+
+        Args:
+            **criteria: JSON-serializable keyword arguments of ``dag.search()``
+
+        Returns:
+            SearchResult: Matching products
+        """
+        return SearchResult.from_geojson(self._post('/search', criteria))
+
+    def count(self, **criteria):
+        """
+        Count products through the service
+
+        Args:
+            **criteria: Keyword arguments of ``ProductCounter.count()``
+
+        Returns:
+            int: Number of matching products
+        """
+        return self._post('/count', criteria)['count']
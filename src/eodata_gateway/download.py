@@ -0,0 +1,301 @@
+"""
+Streaming downloads with inline checksum verification for eodata-gateway
+
+download_product() is a verified alternative to ``dag.download()``, which
+does not check archives against the published checksums. The archive is
+only extracted once verified, following the ``extract``, ``archive_depth``
+and ``delete_archive`` settings of the provider download configuration as
+``dag.download()`` would.
+"""
+import hashlib
+import logging
+import os
+
+import requests
+from eodag.utils import sanitize
+from eodag.utils.exceptions import DownloadError
+
+try:
+    import blake3
+except ImportError:  # BLAKE3 verification is optional
+    blake3 = None
+
+logger = logging.getLogger(__name__)
+
+# OData endpoint publishing the MD5/BLAKE3 checksums of each product
+ODATA_PRODUCT_URL = 'https://catalogue.dataspace.copernicus.eu/odata/v1/Products({uid})'
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_TIMEOUT = 300
+DEFAULT_MAX_RETRIES = 3
+
+
+class ChecksumMismatchError(DownloadError):
+    """Raised when a downloaded file does not match its published checksum"""
+
+
+def _new_hasher(algorithm):
+    """
+    Create an incremental hasher for a checksum algorithm
+
+    Args:
+        algorithm (str): Algorithm name as published by the catalogue (e.g. 'MD5', 'BLAKE3')
+
+    Returns:
+        object: Hasher exposing update() and hexdigest(), or None if unsupported
+    """
+    algorithm = algorithm.lower()
+    if algorithm == 'blake3':
+        return blake3.blake3() if blake3 is not None else None
+    try:
+        return hashlib.new(algorithm)
+    except ValueError:
+        return None
+
+
+def normalize_checksums(checksums):
+    """
+    Normalize published checksums to a {algorithm: hexdigest} dictionary
+
+    Accepts either a mapping or the OData list format
+    ``[{'Algorithm': 'MD5', 'Value': '...'}, ...]``.
+
+    Args:
+        checksums (dict or list): Checksums as published by the catalogue
+
+    Returns:
+        dict: Lower-cased algorithm names mapped to lower-cased hex digests
+    """
+    if not checksums:
+        return {}
+    if isinstance(checksums, dict):
+        items = checksums.items()
+    else:
+        items = (
+            (entry.get('Algorithm') or entry.get('algorithm'), entry.get('Value') or entry.get('value'))
+            for entry in checksums
+        )
+    return {
+        algorithm.lower(): value.lower()
+        for algorithm, value in items
+        if algorithm and value
+    }
+
+
+def fetch_odata_checksums(uid, session=None, timeout=60):
+    """
+    Fetch the checksums published by the OData catalogue for a product
+
+    Args:
+        uid (str): Product identifier (the resto ``id``, shared with OData)
+        session (requests.Session, optional): Session to reuse
+        timeout (int): Request timeout in seconds
+
+    Returns:
+        dict: Checksums as returned by normalize_checksums()
+    """
+    session = session or requests.Session()
+    response = session.get(ODATA_PRODUCT_URL.format(uid=uid), timeout=timeout)
+    response.raise_for_status()
+    return normalize_checksums(response.json().get('Checksum'))
+
+
+def get_product_checksums(product, session=None):
+    """
+    Get the checksums of an EOProduct
+
+    Uses the ``checksum`` property when the search metadata mapping provides
+    it, and falls back to the OData catalogue otherwise.
+
+    Args:
+        product (EOProduct): Product to get checksums for
+        session (requests.Session, optional): Session to reuse
+
+    Returns:
+        dict: Checksums as returned by normalize_checksums()
+    """
+    checksums = normalize_checksums(product.properties.get('checksum'))
+    if checksums:
+        return checksums
+    uid = product.properties.get('uid') or product.properties.get('id')
+    try:
+        return fetch_odata_checksums(uid, session=session)
+    except (requests.RequestException, ValueError) as e:
+        logger.warning(f"Could not fetch checksums for {uid}: {e}")
+        return {}
+
+
+def stream_download(url, dest_path, checksums=None, auth=None, session=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, timeout=DEFAULT_TIMEOUT,
+                    max_retries=DEFAULT_MAX_RETRIES):
+    """
+    Download a file while hashing it, and move it into place once verified
+
+    Data is written to ``<dest_path>.part`` and hashed chunk by chunk as it
+    streams in, so verifying costs no extra pass over the file. The file is
+    atomically renamed to ``dest_path`` only if every supported checksum
+    matches; on mismatch the partial file is discarded and fetched again.
+
+    Args:
+        url (str): URL to download
+        dest_path (str): Final path of the downloaded file
+        checksums (dict or list, optional): Expected checksums
+        auth (requests.auth.AuthBase, optional): Authentication for the request
+        session (requests.Session, optional): Session to reuse
+        chunk_size (int): Size of streamed chunks in bytes
+        timeout (int): Request timeout in seconds
+        max_retries (int): Number of re-fetches allowed after a mismatch
+
+    Returns:
+        str: Path of the verified file
+
+    Raises:
+        ChecksumMismatchError: If the file still mismatches after all retries
+    """
+    session = session or requests.Session()
+    expected = normalize_checksums(checksums)
+    algorithms = []
+    for algorithm in expected:
+        if _new_hasher(algorithm) is None:
+            logger.warning(f"Checksum algorithm {algorithm} unavailable, skipping it")
+        else:
+            algorithms.append(algorithm)
+    if expected and not algorithms:
+        logger.warning(f"No supported checksum for {url}, downloading unverified")
+
+    part_path = f"{dest_path}.part"
+    os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+
+    for attempt in range(max_retries + 1):
+        hashers = {algorithm: _new_hasher(algorithm) for algorithm in algorithms}
+        try:
+            with session.get(url, auth=auth, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                with open(part_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        for hasher in hashers.values():
+                            hasher.update(chunk)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+        mismatches = {
+            algorithm: hasher.hexdigest()
+            for algorithm, hasher in hashers.items()
+            if hasher.hexdigest().lower() != expected[algorithm]
+        }
+        if not mismatches:
+            os.replace(part_path, dest_path)
+            return dest_path
+
+        os.remove(part_path)
+        logger.warning(
+            f"Checksum mismatch for {url} (attempt {attempt + 1}/{max_retries + 1}): {mismatches}"
+        )
+
+    raise ChecksumMismatchError(f"Checksum mismatch for {url} after {max_retries + 1} attempts")
+
+
+def verify_file(path, checksums, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Check a file already on disk against its published checksums
+
+    Args:
+        path (str): Path of the file
+        checksums (dict or list): Expected checksums
+        chunk_size (int): Size of read chunks in bytes
+
+    Returns:
+        bool: True if every supported checksum matches, False on a mismatch
+            or if no supported checksum is available
+    """
+    expected = normalize_checksums(checksums)
+    hashers = {algorithm: _new_hasher(algorithm) for algorithm in expected}
+    hashers = {algorithm: hasher for algorithm, hasher in hashers.items() if hasher is not None}
+    if not hashers:
+        return False
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            for hasher in hashers.values():
+                hasher.update(chunk)
+    return all(hasher.hexdigest().lower() == expected[algorithm] for algorithm, hasher in hashers.items())
+
+
+def _extract(product, archive_path, outputs_prefix, extract):
+    """Extract a verified archive like the product download plugin would"""
+    if product.downloader is None:
+        return archive_path
+    # Absolute paths, the plugin joins the archive path to the output directory
+    kwargs = {'output_dir': os.path.abspath(outputs_prefix)}
+    if extract is not None:
+        kwargs['extract'] = extract
+    return product.downloader._finalize(os.path.abspath(archive_path), **kwargs)
+
+
+def download_product(product, outputs_prefix='./downloads', checksums=None,
+                     session=None, extract=None, **kwargs):
+    """
+    Download an EOProduct archive with inline checksum verification
+
+    An archive already present at the destination, e.g. left by an
+    interrupted ``dag.download()``, is only reused if it matches the
+    checksums, and downloaded again otherwise.
+
+    Args:
+        product (EOProduct): Product returned by a search
+        outputs_prefix (str): Directory where the archive is written
+        checksums (dict or list, optional): Expected checksums. Looked up with
+            get_product_checksums() if not given
+        session (requests.Session, optional): Session to reuse
+        extract (bool, optional): Extract the verified archive. Defaults to the
+            provider download configuration, no extraction for products
+            without a registered downloader
+        **kwargs: Additional arguments passed to stream_download()
+
+    Returns:
+        str: Path of the extracted product, or of the verified archive
+    """
+    filename = f"{sanitize(product.properties['title'])}.zip"
+    dest_path = os.path.join(outputs_prefix, filename)
+    product_path = os.path.splitext(dest_path)[0]
+    if os.path.isdir(product_path) and os.listdir(product_path):
+        logger.info(f"{product_path} already downloaded")
+        return product_path
+
+    session = session or requests.Session()
+    if checksums is None:
+        checksums = get_product_checksums(product, session=session)
+    if os.path.isfile(dest_path) and verify_file(dest_path, checksums):
+        logger.info(f"{dest_path} already downloaded and verified")
+        path = dest_path
+    else:
+        if os.path.isfile(dest_path):
+            logger.warning(f"{dest_path} could not be verified, downloading it again")
+        auth = product.downloader_auth.authenticate() if product.downloader_auth else None
+        path = stream_download(product.remote_location, dest_path, checksums, auth=auth, session=session, **kwargs)
+    path = _extract(product, path, outputs_prefix, extract)
+    product.location = f"file://{os.path.abspath(path)}"
+    return path
+
+
+def register_product(dag, product):
+    """
+    Register the download and authentication plugins of a deserialized product
+
+    Products rebuilt from GeoJSON carry no downloader; this attaches the ones
+    the gateway would have attached after a search.
+
+    Args:
+        dag (EODataAccessGateway): Configured gateway
+        product (EOProduct): Product to register
+
+    Returns:
+        EOProduct: The registered product
+    """
+    if product.downloader is None:
+        downloader = dag._plugins_manager.get_download_plugin(product)
+        auth = product.downloader_auth or dag._plugins_manager.get_auth_plugin(downloader, product)
+        product.register_downloader(downloader, auth)
+    return product
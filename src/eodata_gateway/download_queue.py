@@ -0,0 +1,371 @@
+"""
+Persistent, crash-safe download queue for eodata-gateway
+
+Jobs are stored in a SQLite file shared by any number of worker processes.
+A worker leases a job for a limited time and keeps extending the lease with
+heartbeats while it downloads; if the worker dies, the lease expires and the
+job becomes available to the other workers. Failed jobs are retried with an
+exponential backoff and dead-lettered after ``max_attempts``.
+
+By default the queue uses SQLite write-ahead logging, which needs shared
+memory and therefore all workers on the same host. Workers on several nodes
+can share a queue file on a network filesystem with working POSIX locks when
+it is opened with ``multi_node=True``, which uses a rollback journal instead.
+Leases are then compared between hosts, so their clocks must be synchronized.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from eodag.api.product import EOProduct
+
+from eodata_gateway.download import download_product, register_product
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+DEAD = 'dead'
+
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid TEXT NOT NULL UNIQUE,
+    product TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    location TEXT,
+    last_error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at);
+"""
+
+
+class DownloadQueue:
+    """
+    Durable queue of product download jobs backed by a SQLite file
+
+    Args:
+        path (str): Path of the SQLite queue file
+        lease_seconds (int): Duration of a lease without heartbeat
+        max_attempts (int): Number of attempts before a job is dead-lettered
+        retry_delay (int): Base delay in seconds before retrying a failed job
+        multi_node (bool): Use a rollback journal so that workers on several
+            hosts can share the file, instead of the faster write-ahead log
+            which only works between processes of a single host
+    """
+
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, retry_delay=DEFAULT_RETRY_DELAY, multi_node=False):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.journal_mode = 'DELETE' if multi_node else 'WAL'
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        # One short-lived connection per operation keeps the queue usable
+        # from worker threads and forked processes alike
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.execute(f'PRAGMA journal_mode={self.journal_mode}')
+        conn.row_factory = sqlite3.Row
+        return _Connection(conn)
+
+    def enqueue(self, products):
+        """
+        Add products to the queue, ignoring those already queued
+
+        Args:
+            products (iterable of EOProduct): Products to download, e.g. a SearchResult
+
+        Returns:
+            int: Number of newly queued jobs
+        """
+        now = time.time()
+        rows = [
+            (product.properties.get('uid') or product.properties['id'],
+             json.dumps(product.as_dict()), now)
+            for product in products
+        ]
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO jobs (uid, product, updated_at) VALUES (?, ?, ?)',
+                rows,
+            )
+            queued = conn.total_changes - before
+            conn.execute('COMMIT')
+        return queued
+
+    def lease(self, worker_id):
+        """
+        Lease the next available job
+
+        Pending jobs whose retry delay has elapsed and leased jobs whose lease
+        expired are both eligible.
+
+        Args:
+            worker_id (str): Identifier of the leasing worker
+
+        Returns:
+            sqlite3.Row: The leased job, or None if no job is available
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            job = conn.execute(
+                """
+                SELECT * FROM jobs
+                WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires < ?)
+                ORDER BY id LIMIT 1
+                """,
+                (PENDING, now, LEASED, now),
+            ).fetchone()
+            if job is not None:
+                if job['status'] == LEASED:
+                    logger.warning(f"Lease of job {job['id']} by {job['lease_owner']} expired")
+                conn.execute(
+                    """
+                    UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?,
+                        lease_expires = ?, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (LEASED, worker_id, now + self.lease_seconds, now, job['id']),
+                )
+                job = conn.execute('SELECT * FROM jobs WHERE id = ?', (job['id'],)).fetchone()
+            conn.execute('COMMIT')
+        if job is not None and job['attempts'] > self.max_attempts:
+            self.fail(job['id'], worker_id, 'lease expired too many times')
+            return self.lease(worker_id)
+        return job
+
+    def heartbeat(self, job_id, worker_id):
+        """
+        Extend the lease of a job
+
+        Args:
+            job_id (int): Leased job identifier
+            worker_id (str): Identifier of the worker holding the lease
+
+        Returns:
+            bool: False if the lease was lost to another worker
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs SET lease_expires = ?, updated_at = ?
+                WHERE id = ? AND status = ? AND lease_owner = ?
+                """,
+                (now + self.lease_seconds, now, job_id, LEASED, worker_id),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, location):
+        """
+        Mark a leased job as done
+
+        Args:
+            job_id (int): Leased job identifier
+            worker_id (str): Identifier of the worker holding the lease
+            location (str): Path of the downloaded product
+        """
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE jobs SET status = ?, location = ?, lease_owner = NULL,
+                    lease_expires = NULL, last_error = NULL, updated_at = ?
+                WHERE id = ? AND lease_owner = ?
+                """,
+                (DONE, location, time.time(), job_id, worker_id),
+            )
+
+    def fail(self, job_id, worker_id, error):
+        """
+        Record a failed attempt, scheduling a retry or dead-lettering the job
+
+        Args:
+            job_id (int): Leased job identifier
+            worker_id (str): Identifier of the worker holding the lease
+            error (str): Error message
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            job = conn.execute(
+                'SELECT attempts FROM jobs WHERE id = ? AND lease_owner = ?',
+                (job_id, worker_id),
+            ).fetchone()
+            if job is not None:
+                attempts = job['attempts']
+                status = DEAD if attempts >= self.max_attempts else PENDING
+                available_at = now + self.retry_delay * 2 ** (attempts - 1)
+                conn.execute(
+                    """
+                    UPDATE jobs SET status = ?, available_at = ?, lease_owner = NULL,
+                        lease_expires = NULL, last_error = ?, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (status, available_at, str(error), now, job_id),
+                )
+                if status == DEAD:
+                    logger.error(f"Job {job_id} dead-lettered after {attempts} attempts: {error}")
+            conn.execute('COMMIT')
+
+    def retry_dead(self):
+        """
+        Move dead-lettered jobs back to the queue
+
+        Returns:
+            int: Number of requeued jobs
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, attempts = 0, available_at = 0, updated_at = ? WHERE status = ?',
+                (PENDING, time.time(), DEAD),
+            )
+        return cursor.rowcount
+
+    def stats(self):
+        """
+        Count jobs by status
+
+        Returns:
+            dict: Number of jobs for each status
+        """
+        with self._connect() as conn:
+            rows = conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        counts = dict.fromkeys((PENDING, LEASED, DONE, DEAD), 0)
+        counts.update({status: count for status, count in rows})
+        return counts
+
+
+class _Connection:
+    """Context manager closing a SQLite connection on exit"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._conn.in_transaction:
+            self._conn.execute('ROLLBACK')
+        self._conn.close()
+
+
+def _heartbeat_loop(queue, job_id, worker_id, stop):
+    """Extend a lease until stopped or lost"""
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.heartbeat(job_id, worker_id):
+            logger.warning(f"Lost lease of job {job_id}")
+            return
+
+
+def run_worker(queue, dag, outputs_prefix='./downloads', worker_id=None,
+               poll_interval=10, stop_when_empty=False, **kwargs):
+    """
+    Drain a download queue
+
+    Start several of these, in as many processes or nodes as needed, to
+    scale out a backfill. Workers on several nodes need a queue opened
+    with ``multi_node=True``.
+
+    Args:
+        queue (DownloadQueue): Queue to drain
+        dag (EODataAccessGateway): Configured gateway used to authenticate downloads
+        outputs_prefix (str): Directory where products are written
+        worker_id (str, optional): Worker identifier, generated if None
+        poll_interval (int): Seconds to wait when the queue is empty
+        stop_when_empty (bool): Return once no job is available instead of polling
+        **kwargs: Additional arguments passed to download_product()
+
+    Returns:
+        int: Number of jobs completed by this worker
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    completed = 0
+    while True:
+        job = queue.lease(worker_id)
+        if job is None:
+            if stop_when_empty:
+                return completed
+            time.sleep(poll_interval)
+            continue
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat_loop, args=(queue, job['id'], worker_id, stop), daemon=True
+        )
+        heartbeat.start()
+        try:
+            product = register_product(dag, EOProduct.from_geojson(json.loads(job['product'])))
+            logger.info(f"{worker_id} downloading {product.properties.get('title')}")
+            location = download_product(product, outputs_prefix=outputs_prefix, **kwargs)
+        except Exception as e:
+            logger.warning(f"Job {job['id']} failed: {e}")
+            queue.fail(job['id'], worker_id, e)
+        else:
+            queue.complete(job['id'], worker_id, location)
+            completed += 1
+        finally:
+            stop.set()
+            heartbeat.join()
+
+
+def main():
+    """Command line entry point to run a worker or inspect a queue"""
+    parser = argparse.ArgumentParser(description='eodata-gateway download queue')
+    parser.add_argument('queue', help='Path of the SQLite queue file')
+    parser.add_argument('--multi-node', action='store_true',
+                        help='Queue file shared by workers on several hosts')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    worker_parser = subparsers.add_parser('worker', help='Drain the queue')
+    worker_parser.add_argument('--outputs-prefix', default='./downloads')
+    worker_parser.add_argument('--stop-when-empty', action='store_true')
+    subparsers.add_parser('stats', help='Count jobs by status')
+    subparsers.add_parser('retry-dead', help='Requeue dead-lettered jobs')
+    args = parser.parse_args()
+
+    queue = DownloadQueue(args.queue, multi_node=args.multi_node)
+    if args.command == 'worker':
+        from eodata_gateway.gateway import create_gateway
+
+        logging.basicConfig(level=logging.INFO)
+        completed = run_worker(
+            queue,
+            create_gateway(),
+            outputs_prefix=args.outputs_prefix,
+            stop_when_empty=args.stop_when_empty,
+        )
+        print(f"Completed {completed} jobs")
+    elif args.command == 'stats':
+        print(json.dumps(queue.stats(), indent=2))
+    else:
+        print(f"Requeued {queue.retry_dead()} jobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+GeoParquet export of search results for eodata-gateway
+
+Search results are written as a hive-partitioned GeoParquet dataset
+(``product_type=.../acquisition_date=.../*.parquet``) with footprints encoded
+as WKB. Common properties get typed columns, the remaining ones are kept as a
+JSON string. Each export writes new files, so incremental harvests are
+appended to an existing dataset, and reading back returns an Arrow table
+without rebuilding product objects.
+
+Requires pyarrow, installed with the ``export`` extra.
+"""
+import json
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import shapely
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = ds = None
+
+from eodag.api.search_result import SearchResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROWS_PER_FILE = 100000
+
+# Typed columns, filled from the product properties of the same name
+_PROPERTY_COLUMNS = {
+    'title': 'string',
+    'platform': 'string',
+    'instrument': 'string',
+    'processingLevel': 'string',
+    'sensorMode': 'string',
+    'orbitDirection': 'string',
+    'tileIdentifier': 'string',
+    'orbitNumber': 'int64',
+    'relativeOrbitNumber': 'int64',
+    'cloudCover': 'float64',
+    'downloadLink': 'string',
+    'quicklook': 'string',
+}
+_TIME_PROPERTIES = {
+    'start': 'startTimeFromAscendingNode',
+    'end': 'completionTimeFromAscendingNode',
+}
+_PARTITIONING = ['product_type', 'acquisition_date']
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError(
+            "pyarrow is required for GeoParquet export, install it with `pip install eodata-gateway[export]`"
+        )
+
+
+def _schema():
+    return pa.schema(
+        [
+            ('uid', pa.string()),
+            ('provider', pa.string()),
+            ('product_type', pa.string()),
+            ('acquisition_date', pa.string()),
+            ('start', pa.timestamp('us', tz='UTC')),
+            ('end', pa.timestamp('us', tz='UTC')),
+        ]
+        + [(name, pa.type_for_alias(alias)) for name, alias in _PROPERTY_COLUMNS.items()]
+        + [('properties', pa.string()), ('geometry', pa.binary())]
+    )
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    date = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+def _cast(value, alias):
+    if value is None:
+        return None
+    try:
+        if alias == 'int64':
+            return int(value)
+        if alias == 'float64':
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+
+def _partition_key(product):
+    """(product_type, acquisition_date) partition values of a product"""
+    start = _parse_time(product.properties.get(_TIME_PROPERTIES['start']))
+    product_type = product.product_type or product.properties.get('productType') or 'unknown'
+    return product_type, start.date().isoformat() if start else 'unknown'
+
+
+def products_to_table(products):
+    """
+    Convert products to an Arrow table with GeoParquet metadata
+
+    Args:
+        products (iterable of EOProduct): Products, e.g. a SearchResult
+
+    Returns:
+        pyarrow.Table: One row per product
+    """
+    _require_pyarrow()
+    skipped = {'id', 'uid', 'geometry', 'productType', *_PROPERTY_COLUMNS, *_TIME_PROPERTIES.values()}
+    columns = {name: [] for name in _schema().names}
+    geometries = []
+    for product in products:
+        props = product.properties
+        product_type, acquisition_date = _partition_key(product)
+        columns['uid'].append(props.get('uid') or props['id'])
+        columns['provider'].append(product.provider)
+        columns['product_type'].append(product_type)
+        columns['acquisition_date'].append(acquisition_date)
+        columns['start'].append(_parse_time(props.get(_TIME_PROPERTIES['start'])))
+        columns['end'].append(_parse_time(props.get(_TIME_PROPERTIES['end'])))
+        for name, alias in _PROPERTY_COLUMNS.items():
+            columns[name].append(_cast(props.get(name), alias))
+        columns['properties'].append(
+            json.dumps({key: value for key, value in props.items() if key not in skipped}, default=str)
+        )
+        geometries.append(product.geometry)
+    columns['geometry'] = list(shapely.to_wkb(geometries)) if geometries else []
+
+    table = pa.table(columns, schema=_schema())
+    return table.replace_schema_metadata({b'geo': json.dumps(_geo_metadata(geometries)).encode()})
+
+
+def _geo_metadata(geometries):
+    """GeoParquet 1.0 file metadata for WKB footprints in WGS84"""
+    column = {
+        'encoding': 'WKB',
+        'geometry_types': sorted({geometry.geom_type for geometry in geometries}),
+    }
+    if geometries:
+        column['bbox'] = list(shapely.total_bounds(geometries))
+    return {'version': '1.0.0', 'primary_column': 'geometry', 'columns': {'geometry': column}}
+
+
+def _write(products, root_path):
+    """
+    Write products one partition at a time
+
+    Each partition gets its own table, so the GeoParquet bbox and geometry
+    types of a file only describe its own footprints, and a buffer spanning
+    many days never hits the partition limits of ``ds.write_dataset``.
+    """
+    partitions = defaultdict(list)
+    for product in products:
+        partitions[_partition_key(product)].append(product)
+    basename_template = f"part-{uuid.uuid4().hex}-{{i}}.parquet"
+    for partition in partitions.values():
+        ds.write_dataset(
+            products_to_table(partition),
+            root_path,
+            format='parquet',
+            partitioning=_PARTITIONING,
+            partitioning_flavor='hive',
+            basename_template=basename_template,
+            existing_data_behavior='overwrite_or_ignore',
+            max_partitions=1,
+        )
+
+
+def export_geoparquet(results, root_path, rows_per_file=DEFAULT_ROWS_PER_FILE):
+    """
+    Write search results to a partitioned GeoParquet dataset
+
+    New files are added next to the existing ones, so calling this again
+    with the products of an incremental harvest appends them.
+
+    Args:
+        results: A SearchResult, any iterable of products, or an iterable of
+            SearchResult pages such as ``dag.search_iter_page(...)``
+        root_path (str): Root directory of the dataset
+        rows_per_file (int): Number of products buffered before writing when
+            streaming pages
+
+    Returns:
+        int: Number of exported products
+    """
+    _require_pyarrow()
+    buffer = []
+    exported = 0
+    for item in results:
+        buffer.extend(item if isinstance(item, SearchResult) else [item])
+        if len(buffer) >= rows_per_file:
+            _write(buffer, root_path)
+            exported += len(buffer)
+            buffer = []
+    if buffer:
+        _write(buffer, root_path)
+        exported += len(buffer)
+    logger.info(f"Exported {exported} products to {root_path}")
+    return exported
+
+
+def read_geoparquet(root_path, columns=None, filter=None):
+    """
+    Read a GeoParquet dataset written by export_geoparquet()
+
+    Args:
+        root_path (str): Root directory of the dataset
+        columns (list, optional): Columns to read, all if None
+        filter (pyarrow.compute.Expression, optional): Row filter, e.g.
+            ``pyarrow.compute.field('product_type') == 'S2_MSI_L2A'``, pruning
+            partitions when it applies to partition columns
+
+    Returns:
+        pyarrow.Table: Products, with footprints as WKB in the geometry column
+    """
+    _require_pyarrow()
+    dataset = ds.dataset(root_path, format='parquet', partitioning='hive', schema=_schema())
+    return dataset.to_table(columns=columns, filter=filter)
@@ -0,0 +1,228 @@
+"""
+EODataAccessGateway construction for eodata-gateway
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import eodag
+import yaml
+from dotenv import load_dotenv
+from eodag import EODataAccessGateway
+from eodag import __version__ as eodag_version
+from eodag.utils import GENERIC_PRODUCT_TYPE
+
+from eodata_gateway.config.utils import load_opensearch_provider_config
+
+DEFAULT_PROVIDER = 'cop_dataspace_opensearch'
+
+SLIM_CONFIG_DIR = os.path.join(os.path.expanduser('~'), '.config', 'eodata_gateway', 'slim')
+
+_EODAG_RESOURCES_DIR = os.path.join(os.path.dirname(eodag.__file__), 'resources')
+
+
+def create_gateway(provider=DEFAULT_PROVIDER, config_path=None):
+    """
+    Create an EODataAccessGateway using the OpenSearch provider configuration
+
+    Args:
+        provider (str): Provider to set as preferred
+        config_path (str, optional): Path to the provider configuration file.
+            If None, the default configuration file will be used.
+
+    Returns:
+        EODataAccessGateway: Configured gateway
+    """
+    # Credentials are read from the .env file
+    load_dotenv()
+
+    dag = EODataAccessGateway()
+    dag.update_providers_config(dict_conf=load_opensearch_provider_config(config_path))
+    dag.set_preferred_provider(provider)
+    return dag
+
+
+@contextmanager
+def _environ(**variables):
+    """Temporarily set environment variables"""
+    previous = {name: os.environ.get(name) for name in variables}
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _write_atomic(path, content):
+    """Write a file through a temporary file so that readers never see it partially written"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _write_slim_config(bundled_providers, product_types):
+    """
+    Write eodag providers and product types files restricted to what is used
+
+    Args:
+        bundled_providers (list): Names of eodag bundled providers to keep
+        product_types (list): Product types to keep, in addition to the ones
+            of the bundled providers
+
+    Returns:
+        str: Directory containing providers.yml and product_types.yml
+    """
+    key = json.dumps([eodag_version, sorted(bundled_providers), sorted(product_types)])
+    slim_dir = os.path.join(SLIM_CONFIG_DIR, hashlib.sha1(key.encode()).hexdigest()[:12])
+    # product_types.yml is written last, its presence means the directory is complete
+    if os.path.exists(os.path.join(slim_dir, 'product_types.yml')):
+        return slim_dir
+    os.makedirs(slim_dir, exist_ok=True)
+
+    # Bundled providers are separate YAML documents using custom tags: copy them verbatim
+    with open(os.path.join(_EODAG_RESOURCES_DIR, 'providers.yml')) as f:
+        providers_source = f.read()
+    documents = [
+        document for document in providers_source.split('\n---\n')
+        if (match := re.search(r'^  name: (\S+)$', document, re.MULTILINE))
+        and match.group(1) in bundled_providers
+    ]
+    _write_atomic(os.path.join(slim_dir, 'providers.yml'), ''.join(f"---\n{document}\n" for document in documents))
+
+    # eodag requires every product type listed by a loaded provider to be defined
+    kept = set(product_types) | {GENERIC_PRODUCT_TYPE}
+    for document in documents:
+        products = re.search(r'^  products:\n((?:    .*\n|\s*\n)*)', document + '\n', re.MULTILINE)
+        if products:
+            kept.update(re.findall(r'^    (\w+):', products.group(1), re.MULTILINE))
+
+    with open(os.path.join(_EODAG_RESOURCES_DIR, 'product_types.yml')) as f:
+        all_product_types = yaml.safe_load(f)
+    _write_atomic(
+        os.path.join(slim_dir, 'product_types.yml'),
+        yaml.safe_dump(
+            {name: config for name, config in all_product_types.items() if name in kept},
+            sort_keys=False,
+        ),
+    )
+    return slim_dir
+
+
+def create_slim_gateway(providers=None, product_types=None, provider=DEFAULT_PROVIDER,
+                        config_path=None):
+    """
+    Create an EODataAccessGateway loading only the providers and product types used
+
+    The default gateway parses the configuration of every bundled provider and
+    indexes every product type before our provider is added on top. Here eodag
+    is pointed at trimmed providers and product types files, and at its own
+    configuration directory so the trimmed product types index does not
+    invalidate the one of full gateways. Plugins are still only instantiated
+    by eodag on first use.
+
+    Args:
+        providers (list, optional): Providers to load, bundled or from the
+            OpenSearch provider configuration. Defaults to [provider].
+        product_types (list, optional): Product types to load besides the ones of
+            the bundled providers. Defaults to the products of the loaded providers
+            from the OpenSearch provider configuration.
+        provider (str): Provider to set as preferred
+        config_path (str, optional): Path to the provider configuration file.
+            If None, the default configuration file will be used.
+
+    Returns:
+        EODataAccessGateway: Configured gateway
+    """
+    load_dotenv()
+
+    custom_config = load_opensearch_provider_config(config_path)
+    providers = list(providers or [provider])
+    if product_types is None:
+        product_types = sorted({
+            product_type
+            for name in providers if name in custom_config
+            for product_type in custom_config[name].get('products', {})
+        })
+    slim_dir = _write_slim_config([name for name in providers if name not in custom_config], product_types)
+
+    # Keep reading the user configuration file (credentials) from its usual place
+    user_conf_file_path = os.getenv('EODAG_CFG_FILE') or os.path.join(
+        os.getenv('EODAG_CFG_DIR', os.path.join(os.path.expanduser('~'), '.config', 'eodag')), 'eodag.yml'
+    )
+    with _environ(
+        EODAG_PROVIDERS_CFG_FILE=os.path.join(slim_dir, 'providers.yml'),
+        EODAG_PRODUCT_TYPES_CFG_FILE=os.path.join(slim_dir, 'product_types.yml'),
+        EODAG_CFG_DIR=slim_dir,
+    ):
+        dag = EODataAccessGateway(
+            user_conf_file_path=user_conf_file_path if os.path.isfile(user_conf_file_path) else None
+        )
+
+    custom_providers = {name: custom_config[name] for name in providers if name in custom_config}
+    if custom_providers:
+        dag.update_providers_config(dict_conf=custom_providers)
+    dag.set_preferred_provider(provider)
+    return dag
+
+
+_BENCHMARK_SNIPPET = """
+import json, resource, sys, time
+start = time.perf_counter()
+from eodata_gateway import gateway
+dag = gateway.create_slim_gateway() if sys.argv[1] == 'slim' else gateway.create_gateway()
+print(json.dumps({
+    'seconds': time.perf_counter() - start,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'providers': len(dag.available_providers()),
+}))
+"""
+
+
+def benchmark_startup(repeat=3):
+    """
+    Compare construction time and peak resident memory of full and slim gateways
+
+    Each measurement runs in a fresh interpreter so imports and caches are not shared.
+
+    Args:
+        repeat (int): Number of runs of each mode
+
+    Returns:
+        dict: For 'full' and 'slim', the best time in seconds, the peak RSS in
+            MB and the number of available providers
+    """
+    results = {}
+    for mode in ('full', 'slim'):
+        runs = [
+            json.loads(subprocess.run(
+                [sys.executable, '-c', _BENCHMARK_SNIPPET, mode],
+                check=True, capture_output=True, text=True,
+            ).stdout.strip().splitlines()[-1])
+            for _ in range(repeat)
+        ]
+        results[mode] = {
+            'seconds': min(run['seconds'] for run in runs),
+            'max_rss_mb': min(run['max_rss_mb'] for run in runs),
+            'providers': runs[0]['providers'],
+        }
+    return results
+
+
+if __name__ == "__main__":
+    for mode, result in benchmark_startup().items():
+        print(f"{mode}: {result['seconds']:.2f}s, {result['max_rss_mb']:.0f} MB peak RSS, "
+              f"{result['providers']} providers")
@@ -0,0 +1,108 @@
+"""
+Search geometry simplification with exact local refinement for eodata-gateway
+
+Complex AOIs (coastlines, administrative boundaries) make the ``geometry``
+query parameter huge. The server is sent a simplified superset of the AOI
+instead, and the returned footprints are intersected with the exact AOI
+locally in one vectorized shapely call. Since the server geometry always
+contains the AOI, no matching product is lost and the refined result equals
+the one of the unsimplified query.
+"""
+import logging
+import math
+
+import numpy as np
+import shapely
+from eodag.api.search_result import SearchResult
+from eodag.utils import get_geometry_from_various
+
+logger = logging.getLogger(__name__)
+
+# Longest WKT sent to the server
+DEFAULT_MAX_WKT_LENGTH = 2000
+# Decimals kept by the last resort bounding box, about 10 m
+_BOX_DECIMALS = 4
+
+
+def server_geometry(geom, max_wkt_length=DEFAULT_MAX_WKT_LENGTH):
+    """
+    Get a compact geometry containing a search area
+
+    Tries, in order, the area itself, Douglas-Peucker simplifications buffered
+    by their tolerance (which contain the original), its convex hull and
+    finally its bounding box rounded outwards, keeping the first one whose WKT
+    fits (the bounding box is returned as a last resort whatever its length).
+
+    Args:
+        geom: Search area, in any form accepted by ``dag.search()``
+        max_wkt_length (int): Maximum length of the WKT sent to the server
+
+    Returns:
+        shapely.Geometry: Geometry containing the search area
+    """
+    geometry = get_geometry_from_various(geometry=geom)
+    if len(geometry.wkt) <= max_wkt_length:
+        return geometry
+
+    minx, miny, maxx, maxy = geometry.bounds
+    extent = max(maxx - minx, maxy - miny)
+    for fraction in (0.001, 0.005, 0.01, 0.05):
+        tolerance = extent * fraction
+        candidate = geometry.simplify(tolerance).buffer(tolerance, quad_segs=1)
+        candidate = shapely.set_precision(candidate, tolerance / 10, mode='keep_collapsed')
+        if len(candidate.wkt) <= max_wkt_length and candidate.covers(geometry):
+            return candidate
+
+    hull = geometry.convex_hull
+    if len(hull.wkt) <= max_wkt_length:
+        return hull
+    scale = 10 ** _BOX_DECIMALS
+    return shapely.box(
+        math.floor(minx * scale) / scale, math.floor(miny * scale) / scale,
+        math.ceil(maxx * scale) / scale, math.ceil(maxy * scale) / scale,
+    )
+
+
+def refine(products, geom):
+    """
+    Keep the products whose footprint intersects the exact search area
+
+    Args:
+        products (iterable of EOProduct): Products returned by the server
+        geom: Exact search area, in any form accepted by ``dag.search()``
+
+    Returns:
+        tuple: SearchResult of the kept products and fraction of discarded products
+    """
+    products = list(products)
+    if not products:
+        return SearchResult([]), 0.0
+    geometry = get_geometry_from_various(geometry=geom)
+    shapely.prepare(geometry)
+    footprints = np.array([product.geometry for product in products], dtype=object)
+    keep = shapely.intersects(geometry, footprints)
+    kept = [product for product, intersects in zip(products, keep) if intersects]
+    return SearchResult(kept, number_matched=len(kept)), 1 - len(kept) / len(products)
+
+
+def search_simplified(dag, geom, max_wkt_length=DEFAULT_MAX_WKT_LENGTH, **kwargs):
+    """
+    Search all products over a complex area with a compact server geometry
+
+    Args:
+        dag (EODataAccessGateway): Configured gateway
+        geom: Exact search area, in any form accepted by ``dag.search()``
+        max_wkt_length (int): Maximum length of the WKT sent to the server
+        **kwargs: Other search criteria passed to ``dag.search_all()``
+
+    Returns:
+        tuple: SearchResult matching the exact area and fraction of server
+            results discarded by the local refinement
+    """
+    geometry = get_geometry_from_various(geometry=geom)
+    simplified = server_geometry(geometry, max_wkt_length)
+    logger.debug(f"Search geometry WKT reduced from {len(geometry.wkt)} to {len(simplified.wkt)} characters")
+
+    products, discarded = refine(dag.search_all(geom=simplified, **kwargs), geometry)
+    logger.info(f"Local refinement discarded {discarded:.1%} of the server results")
+    return products, discarded
@@ -0,0 +1,260 @@
+"""
+Process graph deduplication and local result cache for openEO jobs
+
+Process graphs are identified by a canonical hash that ignores node ids
+(``loadcollection1``, ``reducedimension2``, ...) and argument ordering, so
+graphs built independently but describing the same computation share a key.
+Only whole graphs are reused: the result node, usually ``save_result``, also
+fixes the output format, and intermediate results are never downloaded.
+
+Results of graphs whose temporal extent reaches into recent acquisitions
+expire after ``recent_ttl``, since new or reprocessed scenes may still land
+in that window; results over older periods are kept until removed.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'eodata_gateway', 'openeo')
+DEFAULT_RECENT_DAYS = 30
+DEFAULT_RECENT_TTL = 24 * 3600
+
+# Processes and arguments carrying temporal extents
+_TEMPORAL_ARGUMENTS = {
+    'load_collection': 'temporal_extent',
+    'filter_temporal': 'extent',
+}
+
+
+def _flat_graph(process_graph):
+    """Get the flat graph of a DataCube, a flat graph dict or a {'process_graph': ...} dict"""
+    if hasattr(process_graph, 'flat_graph'):
+        process_graph = process_graph.flat_graph()
+    if 'process_graph' in process_graph:
+        process_graph = process_graph['process_graph']
+    return process_graph
+
+
+def _canonical(value, node_hash):
+    """Replace node references by node hashes in an argument value"""
+    if isinstance(value, dict):
+        if set(value) == {'from_node'}:
+            return {'from_node': node_hash(value['from_node'])}
+        if set(value) == {'process_graph'}:
+            return {'process_graph': graph_hash(value['process_graph'])}
+        return {key: _canonical(item, node_hash) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_canonical(item, node_hash) for item in value]
+    return value
+
+
+def node_hashes(process_graph):
+    """
+    Compute the canonical hash of every node of a process graph
+
+    Args:
+        process_graph (DataCube or dict): Process graph
+
+    Returns:
+        dict: Node ids mapped to the hash of the sub-graph they compute
+    """
+    graph = _flat_graph(process_graph)
+    hashes = {}
+
+    def node_hash(node_id):
+        if node_id not in hashes:
+            node = graph[node_id]
+            canonical = {
+                'process_id': node['process_id'],
+                'namespace': node.get('namespace'),
+                'arguments': _canonical(node.get('arguments', {}), node_hash),
+            }
+            payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+            hashes[node_id] = hashlib.sha256(payload.encode()).hexdigest()
+        return hashes[node_id]
+
+    for node_id in graph:
+        node_hash(node_id)
+    return hashes
+
+
+def graph_hash(process_graph):
+    """
+    Compute the canonical hash of a process graph
+
+    Args:
+        process_graph (DataCube or dict): Process graph
+
+    Returns:
+        str: Hash of the result node
+    """
+    graph = _flat_graph(process_graph)
+    hashes = node_hashes(graph)
+    result_nodes = [node_id for node_id, node in graph.items() if node.get('result')]
+    if len(result_nodes) != 1:
+        # No single result node flagged: hash the whole graph instead
+        return hashlib.sha256(''.join(sorted(hashes.values())).encode()).hexdigest()
+    return hashes[result_nodes[0]]
+
+
+def temporal_end(process_graph):
+    """
+    Get the latest date a process graph reads data for
+
+    Args:
+        process_graph (DataCube or dict): Process graph
+
+    Returns:
+        datetime: Latest temporal extent end, or None if any extent is open-ended
+            or the graph has no temporal extent
+    """
+    ends = []
+    for node in _flat_graph(process_graph).values():
+        argument = _TEMPORAL_ARGUMENTS.get(node['process_id'])
+        extent = node.get('arguments', {}).get(argument) if argument else None
+        if extent is None:
+            continue
+        if not isinstance(extent, list) or len(extent) != 2 or not isinstance(extent[1], str):
+            return None
+        end = datetime.fromisoformat(extent[1].replace('Z', '+00:00'))
+        ends.append(end if end.tzinfo else end.replace(tzinfo=timezone.utc))
+    return max(ends) if ends else None
+
+
+class OpenEOResultCache:
+    """
+    Local store of openEO job results keyed by canonical process graph hash
+
+    Args:
+        cache_dir (str): Directory where results are stored
+        recent_days (int): Graphs whose temporal extent ends less than this
+            many days ago are considered to include recent acquisitions
+        recent_ttl (int): Lifetime in seconds of results including recent
+            acquisitions
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, recent_days=DEFAULT_RECENT_DAYS,
+                 recent_ttl=DEFAULT_RECENT_TTL):
+        self.cache_dir = cache_dir
+        self.recent_days = recent_days
+        self.recent_ttl = recent_ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _expires_at(self, process_graph, now):
+        end = temporal_end(process_graph)
+        recent_limit = datetime.now(timezone.utc) - timedelta(days=self.recent_days)
+        if end is None or end > recent_limit:
+            return now + self.recent_ttl
+        return None
+
+    def _get_by_key(self, key):
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, 'entry.json'), 'r') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        if entry['expires_at'] is not None and entry['expires_at'] < time.time():
+            logger.info(f"Cached result {key} expired")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+        return [os.path.join(entry_dir, 'files', name) for name in entry['files']]
+
+    def get(self, process_graph):
+        """
+        Get the cached result files of a process graph
+
+        Args:
+            process_graph (DataCube or dict): Process graph
+
+        Returns:
+            list: Paths of the cached result files, or None on miss or expiry
+        """
+        return self._get_by_key(graph_hash(process_graph))
+
+    def put(self, process_graph, paths):
+        """
+        Store the result files of a process graph
+
+        Args:
+            process_graph (DataCube or dict): Process graph
+            paths (list): Paths of the result files
+
+        Returns:
+            list: Paths of the cached copies
+        """
+        key = graph_hash(process_graph)
+        now = time.time()
+        tmp_dir = f"{self._entry_dir(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        files_dir = os.path.join(tmp_dir, 'files')
+        os.makedirs(files_dir, exist_ok=True)
+        names = []
+        for path in paths:
+            name = os.path.basename(path)
+            shutil.copy2(path, os.path.join(files_dir, name))
+            names.append(name)
+        entry = {
+            'hash': key,
+            'created_at': now,
+            'expires_at': self._expires_at(process_graph, now),
+            'files': names,
+            'process_graph': _flat_graph(process_graph),
+        }
+        with open(os.path.join(tmp_dir, 'entry.json'), 'w') as f:
+            json.dump(entry, f, indent=2)
+
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        os.replace(tmp_dir, self._entry_dir(key))
+        return [os.path.join(self._entry_dir(key), 'files', name) for name in names]
+
+    def materialize(self, process_graph, target):
+        """
+        Copy the cached result files of a process graph into a directory
+
+        Args:
+            process_graph (DataCube or dict): Process graph
+            target (str): Destination directory
+
+        Returns:
+            list: Paths of the copied files, or None on miss or expiry
+        """
+        paths = self.get(process_graph)
+        if paths is None:
+            return None
+        os.makedirs(target, exist_ok=True)
+        return [shutil.copy2(path, os.path.join(target, os.path.basename(path))) for path in paths]
+
+    def invalidate(self, process_graph=None):
+        """
+        Remove cached results
+
+        Args:
+            process_graph (DataCube or dict, optional): Process graph whose
+                result is removed. If None, every expired result is removed.
+
+        Returns:
+            int: Number of removed results
+        """
+        if process_graph is not None:
+            entry_dir = self._entry_dir(graph_hash(process_graph))
+            if not os.path.isdir(entry_dir):
+                return 0
+            shutil.rmtree(entry_dir)
+            return 1
+
+        removed = 0
+        for key in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self._entry_dir(key), 'entry.json')
+            if os.path.exists(entry_path) and self._get_by_key(key) is None:
+                removed += 1
+        return removed
@@ -0,0 +1,293 @@
+"""
+Concurrent openEO batch job orchestration for eodata-gateway
+
+Replaces the one-job-at-a-time ``job.start_and_wait().download_results()``
+workflow: many process graphs are submitted up to the backend concurrency
+quota, their statuses are polled together with a backoff, and results are
+downloaded in parallel as soon as each job finishes. Progress is persisted
+to a JSON state file so a restart resumes tracking instead of resubmitting.
+
+Jobs with identical process graphs are only submitted once, and with an
+OpenEOResultCache results computed by earlier runs are reused without
+touching the backend.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from eodata_gateway.openeo_cache import graph_hash
+
+logger = logging.getLogger(__name__)
+
+# Local job states
+QUEUED = 'queued'
+SUBMITTED = 'submitted'
+FINISHED = 'finished'
+DOWNLOADED = 'downloaded'
+ERROR = 'error'
+CANCELED = 'canceled'
+
+TERMINAL_STATES = (DOWNLOADED, ERROR, CANCELED)
+
+DEFAULT_MAX_CONCURRENT = 2
+DEFAULT_POLL_INTERVAL = 10
+DEFAULT_MAX_POLL_INTERVAL = 120
+DEFAULT_DOWNLOAD_WORKERS = 4
+
+
+def _to_flat_graph(process_graph):
+    """Get the JSON-serializable flat graph of a DataCube or process graph dict"""
+    if hasattr(process_graph, 'flat_graph'):
+        return process_graph.flat_graph()
+    return process_graph
+
+
+class OpenEOJobManager:
+    """
+    Submit, track and download many openEO batch jobs concurrently
+
+    Args:
+        connection (openeo.Connection): Authenticated connection, or any stub
+            exposing create_job(), job() and list_jobs()
+        state_path (str): Path of the JSON file persisting job progress
+        output_dir (str): Directory where results are downloaded, one
+            subdirectory per job name
+        max_concurrent (int): Maximum number of jobs running on the backend
+        poll_interval (float): Initial delay in seconds between status polls
+        max_poll_interval (float): Maximum delay between polls when nothing changes
+        download_workers (int): Number of parallel result downloads
+        cache (OpenEOResultCache, optional): Result cache to reuse and fill
+    """
+
+    def __init__(self, connection, state_path, output_dir='./openeo_results',
+                 max_concurrent=DEFAULT_MAX_CONCURRENT, poll_interval=DEFAULT_POLL_INTERVAL,
+                 max_poll_interval=DEFAULT_MAX_POLL_INTERVAL,
+                 download_workers=DEFAULT_DOWNLOAD_WORKERS, cache=None):
+        self.connection = connection
+        self.state_path = state_path
+        self.output_dir = output_dir
+        self.max_concurrent = max_concurrent
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.download_workers = download_workers
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.jobs = self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, 'r') as f:
+            return json.load(f)
+
+    def _save_state(self):
+        with self._lock:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.jobs, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+
+    def _update(self, name, **fields):
+        with self._lock:
+            self.jobs[name].update(fields, updated_at=time.time())
+        self._save_state()
+
+    def add_job(self, name, process_graph, title=None, job_options=None):
+        """
+        Register a process graph to run, unless a job with this name exists
+
+        A cached result is copied to the job result directory right away. A
+        graph identical to one of a pending job waits for that job results
+        instead of being submitted again.
+
+        Args:
+            name (str): Unique job name, also used as result subdirectory
+            process_graph (DataCube or dict): Process graph to execute, e.g. the
+                result of ``cube.save_result(format='GTIFF')``
+            title (str, optional): Job title on the backend, defaults to name
+            job_options (dict, optional): Backend specific job options
+
+        Returns:
+            bool: False if the job was already registered
+        """
+        if name in self.jobs:
+            return False
+        process_graph = _to_flat_graph(process_graph)
+        key = graph_hash(process_graph)
+        duplicate_of = next(
+            (
+                other for other, job in self.jobs.items()
+                if job.get('graph_hash') == key and job['status'] in (QUEUED, SUBMITTED, FINISHED)
+                and not job.get('duplicate_of')
+            ),
+            None,
+        )
+        self.jobs[name] = {
+            'status': QUEUED,
+            'process_graph': process_graph,
+            'graph_hash': key,
+            'duplicate_of': duplicate_of,
+            'title': title or name,
+            'job_options': job_options,
+            'job_id': None,
+            'backend_status': None,
+            'started': False,
+            'results': None,
+            'error': None,
+            'updated_at': time.time(),
+        }
+
+        cached = None
+        if self.cache is not None and duplicate_of is None:
+            cached = self.cache.materialize(process_graph, os.path.join(self.output_dir, name))
+        if cached is not None:
+            logger.info(f"Reusing cached results for job {name}")
+            self.jobs[name].update(status=DOWNLOADED, results=cached)
+        elif duplicate_of is not None:
+            logger.info(f"Job {name} has the same process graph as {duplicate_of}")
+        self._save_state()
+        return True
+
+    def _names_in(self, *states):
+        return [name for name, job in self.jobs.items() if job['status'] in states]
+
+    def _submit_queued(self):
+        """Create and start queued jobs while the concurrency quota allows"""
+        active = len(self._names_in(SUBMITTED))
+        queued = [name for name in self._names_in(QUEUED) if not self.jobs[name].get('duplicate_of')]
+        for name in queued[:max(self.max_concurrent - active, 0)]:
+            job = self.jobs[name]
+            try:
+                batch_job = self.connection.create_job(
+                    job['process_graph'], title=job['title'], job_options=job['job_options']
+                )
+            except Exception as e:
+                logger.error(f"Could not submit job {name}: {e}")
+                self._update(name, status=ERROR, error=str(e))
+                self._resolve_duplicates(name)
+                continue
+            # Persist the job id before starting so a crash cannot resubmit it
+            self._update(name, status=SUBMITTED, job_id=batch_job.job_id, backend_status='created', started=False)
+            self._start(name)
+
+    def _start(self, name):
+        """Start a created job, also used for jobs created before a crash but never started"""
+        job_id = self.jobs[name]['job_id']
+        try:
+            self.connection.job(job_id).start()
+        except Exception as e:
+            logger.error(f"Could not start job {name}: {e}")
+            self._update(name, status=ERROR, error=str(e))
+            self._resolve_duplicates(name)
+        else:
+            logger.info(f"Submitted job {name} as {job_id}")
+            self._update(name, started=True)
+
+    def _poll_statuses(self):
+        """
+        Get the backend status of every submitted job
+
+        Uses a single job listing request when possible, and falls back to
+        one request per job for jobs missing from the listing.
+        """
+        names = self._names_in(SUBMITTED)
+        statuses = {}
+        try:
+            statuses = {job['id']: job['status'] for job in self.connection.list_jobs(limit=None)}
+        except Exception as e:
+            logger.debug(f"Job listing unavailable, polling jobs one by one: {e}")
+        for name in names:
+            job_id = self.jobs[name]['job_id']
+            if job_id in statuses:
+                continue
+            try:
+                statuses[job_id] = self.connection.job(job_id).status()
+            except Exception as e:
+                # Keep the previous status and try again at the next poll
+                logger.warning(f"Could not get the status of job {name}: {e}")
+                statuses[job_id] = self.jobs[name]['backend_status']
+        return {name: statuses[self.jobs[name]['job_id']] for name in names}
+
+    def _download(self, name):
+        """Download the results of a finished job"""
+        job = self.jobs[name]
+        target = os.path.join(self.output_dir, name)
+        try:
+            paths = self.connection.job(job['job_id']).get_results().download_files(target)
+        except Exception as e:
+            logger.error(f"Could not download results of job {name}: {e}")
+            self._update(name, status=ERROR, error=str(e))
+        else:
+            logger.info(f"Downloaded results of job {name} to {target}")
+            paths = [str(path) for path in paths]
+            self._update(name, status=DOWNLOADED, results=paths)
+            if self.cache is not None:
+                self.cache.put(job['process_graph'], paths)
+        self._resolve_duplicates(name)
+
+    def _resolve_duplicates(self, name):
+        """Share the results of a terminated job with the jobs waiting for it"""
+        job = self.jobs[name]
+        for other in [other for other, dup in self.jobs.items() if dup.get('duplicate_of') == name]:
+            if job['status'] != DOWNLOADED:
+                # Submit the duplicate on its own rather than failing it as well
+                self._update(other, duplicate_of=None)
+                continue
+            target = os.path.join(self.output_dir, other)
+            os.makedirs(target, exist_ok=True)
+            paths = [shutil.copy2(path, os.path.join(target, os.path.basename(path))) for path in job['results']]
+            self._update(other, status=DOWNLOADED, duplicate_of=None, results=paths)
+
+    def run(self):
+        """
+        Run all registered jobs until they are downloaded, failed or canceled
+
+        Returns:
+            dict: Job names mapped to their final local state
+        """
+        interval = self.poll_interval
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            downloads = {}
+            # Jobs created but not started before a restart would otherwise stay created
+            for name in self._names_in(SUBMITTED):
+                if not self.jobs[name].get('started', True):
+                    self._start(name)
+            # Jobs finished on the backend before a restart still need their results
+            for name in self._names_in(FINISHED):
+                downloads[name] = executor.submit(self._download, name)
+            for name in self._names_in(*TERMINAL_STATES):
+                self._resolve_duplicates(name)
+
+            while True:
+                self._submit_queued()
+
+                changed = False
+                for name, backend_status in self._poll_statuses().items():
+                    if backend_status == self.jobs[name]['backend_status']:
+                        continue
+                    changed = True
+                    if backend_status == 'finished':
+                        self._update(name, status=FINISHED, backend_status=backend_status)
+                        downloads[name] = executor.submit(self._download, name)
+                    elif backend_status in ('error', 'canceled'):
+                        status = ERROR if backend_status == 'error' else CANCELED
+                        self._update(name, status=status, backend_status=backend_status,
+                                     error=f"Backend job status: {backend_status}")
+                        logger.error(f"Job {name} ended with status {backend_status}")
+                        self._resolve_duplicates(name)
+                    else:
+                        self._update(name, backend_status=backend_status)
+
+                downloads = {name: future for name, future in downloads.items() if not future.done()}
+                if not self._names_in(QUEUED, SUBMITTED) and not downloads:
+                    break
+
+                # Back off while nothing changes, react quickly otherwise
+                interval = self.poll_interval if changed else min(interval * 2, self.max_poll_interval)
+                time.sleep(interval)
+
+        return {name: job['status'] for name, job in self.jobs.items()}
@@ -0,0 +1,445 @@
+"""
+Local-first search planning for eodata-gateway
+
+The planner keeps, in a SQLite file, the products already harvested and
+coverage records telling which product type x bbox x time window boxes were
+fully searched, and when. An incoming search is split into the part answered
+by fresh coverage records and a minimal remainder sent to the remote
+catalogue; both are merged into one SearchResult.
+
+As with the startDate and completionDate parameters of the remote
+catalogue, a product matches a time window when its acquisition starts in
+it, both bounds included, so local answers match remote ones.
+
+Coverage is only reused between searches using the same additional criteria
+(cloud cover, sensor mode, ...), since products cannot be filtered on those
+locally.
+"""
+import heapq
+import json
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from eodag.api.product import EOProduct
+from eodag.api.search_result import SearchResult
+from eodag.utils import get_geometry_from_various
+import shapely
+from shapely.geometry import shape
+
+from eodata_gateway.download import register_product
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE = 24 * 3600
+DEFAULT_MAX_PIECES = 8
+DEFAULT_MAX_COVERS = 32
+# Remainder pieces kept while subtracting covers, as a multiple of max_pieces
+_WORKING_PIECES_FACTOR = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS coverage (
+    product_type TEXT NOT NULL,
+    filters TEXT NOT NULL,
+    minx REAL, miny REAL, maxx REAL, maxy REAL,
+    start REAL, end REAL,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_key ON coverage (product_type, filters);
+CREATE TABLE IF NOT EXISTS products (
+    uid TEXT NOT NULL,
+    product_type TEXT NOT NULL,
+    filters TEXT NOT NULL,
+    minx REAL, miny REAL, maxx REAL, maxy REAL,
+    start REAL, end REAL,
+    feature TEXT NOT NULL,
+    PRIMARY KEY (uid, product_type, filters)
+);
+CREATE INDEX IF NOT EXISTS products_key ON products (product_type, filters, start, end);
+"""
+
+
+def _timestamp(value):
+    """Convert an ISO 8601 date or datetime to a UTC POSIX timestamp"""
+    if isinstance(value, datetime):
+        date = value
+    else:
+        date = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def subtract_box(minuend, subtrahend):
+    """
+    Subtract a box from another one
+
+    Boxes are (lonmin, latmin, start, lonmax, latmax, end) tuples, i.e. the
+    lower then upper corners of a box in lon x lat x time space.
+
+    Args:
+        minuend (tuple): Box to subtract from
+        subtrahend (tuple): Box to subtract
+
+    Returns:
+        list: Disjoint boxes covering minuend minus subtrahend
+    """
+    dims = len(minuend) // 2
+    lower, upper = list(minuend[:dims]), list(minuend[dims:])
+    sub_lower, sub_upper = subtrahend[:dims], subtrahend[dims:]
+    if any(sub_lower[d] >= upper[d] or sub_upper[d] <= lower[d] for d in range(dims)):
+        return [minuend]
+
+    pieces = []
+    for d in range(dims):
+        # Cut off the slabs of the remaining box lying outside the subtrahend along d
+        if lower[d] < sub_lower[d]:
+            piece_upper = list(upper)
+            piece_upper[d] = sub_lower[d]
+            pieces.append(tuple(lower) + tuple(piece_upper))
+            lower[d] = sub_lower[d]
+        if upper[d] > sub_upper[d]:
+            piece_lower = list(lower)
+            piece_lower[d] = sub_upper[d]
+            pieces.append(tuple(piece_lower) + tuple(upper))
+            upper[d] = sub_upper[d]
+    return pieces
+
+
+def _bounding_box(boxes):
+    dims = len(boxes[0]) // 2
+    return tuple(min(b[d] for b in boxes) for d in range(dims)) + tuple(
+        max(b[dims + d] for b in boxes) for d in range(dims)
+    )
+
+
+def _volume(box):
+    dims = len(box) // 2
+    volume = 1.0
+    for d in range(dims):
+        volume *= max(box[dims + d] - box[d], 0.0)
+    return volume
+
+
+def _contains(outer, inner):
+    dims = len(outer) // 2
+    return all(outer[d] <= inner[d] and inner[dims + d] <= outer[dims + d] for d in range(dims))
+
+
+def _overlap(first, second):
+    """Volume of the intersection of two boxes"""
+    dims = len(first) // 2
+    volume = 1.0
+    for d in range(dims):
+        volume *= max(min(first[dims + d], second[dims + d]) - max(first[d], second[d]), 0.0)
+    return volume
+
+
+def _merge_cost(first, second):
+    merged = _bounding_box([first, second])
+    return _volume(merged) - _volume(first) - _volume(second), merged
+
+
+def merge_pieces(pieces, max_pieces):
+    """
+    Merge disjoint boxes until there are at most max_pieces of them
+
+    The two boxes whose bounding box adds the least volume outside of them
+    are merged first, so adjacent boxes are merged at no cost and the
+    merged boxes cover as little already covered space as possible. Merge
+    costs are kept in a heap, only the costs of the new box are computed
+    after each merge.
+
+    Args:
+        pieces (list): Disjoint boxes
+        max_pieces (int): Maximum number of boxes to return
+
+    Returns:
+        list: Boxes covering all pieces
+    """
+    alive = dict(enumerate(pieces))
+    heap = [
+        (*_merge_cost(pieces[i], pieces[j]), i, j)
+        for i in range(len(pieces))
+        for j in range(i + 1, len(pieces))
+    ]
+    heapq.heapify(heap)
+    next_id = len(pieces)
+    while len(alive) > max(max_pieces, 1):
+        _, merged, i, j = heapq.heappop(heap)
+        if i not in alive or j not in alive:
+            continue
+        for k in [k for k, piece in alive.items() if _contains(merged, piece)]:
+            del alive[k]
+        for k, piece in alive.items():
+            heapq.heappush(heap, (*_merge_cost(piece, merged), k, next_id))
+        alive[next_id] = merged
+        next_id += 1
+    return list(alive.values())
+
+
+def select_covers(query, covered, max_covers=DEFAULT_MAX_COVERS):
+    """
+    Select the covered boxes worth subtracting from a query box
+
+    Boxes not overlapping the query are dropped and only the max_covers
+    ones overlapping it the most are kept, largest overlap first.
+
+    Args:
+        query (tuple): Query box
+        covered (list): Covered boxes
+        max_covers (int): Maximum number of boxes to keep
+
+    Returns:
+        list: Selected boxes
+    """
+    overlaps = sorted(
+        ((_overlap(query, cover), index) for index, cover in enumerate(covered)), reverse=True
+    )
+    return [covered[index] for overlap, index in overlaps[:max_covers] if overlap > 0]
+
+
+def remainder(query, covered, max_pieces=DEFAULT_MAX_PIECES, max_covers=DEFAULT_MAX_COVERS):
+    """
+    Compute the part of a query box not covered by a set of boxes
+
+    Subtracting overlapping boxes fragments the remainder quickly, so only
+    the covers selected by select_covers() are used, covers overlapping none
+    of the remaining pieces are skipped, and the pieces are merged whenever
+    they outgrow a small multiple of max_pieces.
+
+    Args:
+        query (tuple): Query box
+        covered (list): Covered boxes
+        max_pieces (int): Maximum number of remote requests; beyond it the
+            closest pieces of the remainder are merged
+        max_covers (int): Maximum number of covered boxes used
+
+    Returns:
+        list: Boxes to fetch remotely
+    """
+    max_working = _WORKING_PIECES_FACTOR * max(max_pieces, 1)
+    pieces = [query]
+    for cover in select_covers(query, covered, max_covers):
+        if not any(_overlap(cover, piece) for piece in pieces):
+            continue
+        pieces = [piece for p in pieces for piece in subtract_box(p, cover)]
+        if not pieces:
+            return []
+        if len(pieces) > max_working:
+            pieces = merge_pieces(pieces, max_working // 2)
+    return merge_pieces(pieces, max_pieces)
+
+
+class QueryPlanner:
+    """
+    Answer searches from local data first and fetch only the gaps
+
+    Args:
+        dag (EODataAccessGateway): Configured gateway used for remote searches
+        path (str): Path of the SQLite store of products and coverage records
+        max_age (float): Seconds a coverage record stays fresh
+        max_pieces (int): Maximum number of remote requests per search
+        max_covers (int): Maximum number of coverage records used per search
+    """
+
+    def __init__(self, dag, path, max_age=DEFAULT_MAX_AGE, max_pieces=DEFAULT_MAX_PIECES,
+                 max_covers=DEFAULT_MAX_COVERS):
+        self.dag = dag
+        self.path = path
+        self.max_age = max_age
+        self.max_pieces = max_pieces
+        self.max_covers = max_covers
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def plan(self, productType, start, end, geom, **kwargs):
+        """
+        Split a search into locally covered and remote parts
+
+        Args:
+            productType (str): Product type searched
+            start (str): Start of the time window, ISO 8601
+            end (str): End of the time window, ISO 8601
+            geom: Search area, in any form accepted by ``dag.search()``
+            **kwargs: Additional search criteria
+
+        Returns:
+            tuple: Query box and list of boxes to fetch remotely
+        """
+        query, pieces, _ = self._plan(productType, start, end, geom, **kwargs)
+        return query, pieces
+
+    def _plan(self, productType, start, end, geom, **kwargs):
+        """Like plan(), also returning the oldest fetch time of the coverage records used"""
+        lonmin, latmin, lonmax, latmax = get_geometry_from_various(geometry=geom).bounds
+        query = (lonmin, latmin, _timestamp(start), lonmax, latmax, _timestamp(end))
+        filters = json.dumps(kwargs, sort_keys=True, default=str)
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT minx, miny, start, maxx, maxy, end, fetched_at FROM coverage
+                WHERE product_type = ? AND filters = ? AND fetched_at >= ?
+                    AND minx < ? AND maxx > ? AND miny < ? AND maxy > ? AND start < ? AND end > ?
+                """,
+                (productType, filters, time.time() - self.max_age,
+                 query[3], query[0], query[4], query[1], query[5], query[2]),
+            ).fetchall()
+        covers = select_covers(query, [row[:6] for row in rows], self.max_covers)
+        selected = set(covers)
+        fetched_at = min((row[6] for row in rows if row[:6] in selected), default=time.time())
+        return query, remainder(query, covers, self.max_pieces, self.max_covers), fetched_at
+
+    def _fetch(self, productType, filters, piece, **kwargs):
+        """Search a box remotely and record its products and coverage"""
+        lonmin, latmin, start, lonmax, latmax, end = piece
+        results = self.dag.search_all(
+            productType=productType,
+            start=_isoformat(start),
+            end=_isoformat(end),
+            geom=[lonmin, latmin, lonmax, latmax],
+            **kwargs,
+        )
+        # Products of the piece not returned anymore were removed from the catalogue
+        box = shapely.box(lonmin, latmin, lonmax, latmax)
+        with self._connect() as conn:
+            stored = conn.execute(
+                """
+                SELECT uid, feature FROM products
+                WHERE product_type = ? AND filters = ?
+                    AND minx <= ? AND maxx >= ? AND miny <= ? AND maxy >= ? AND start >= ? AND start <= ?
+                """,
+                (productType, filters, lonmax, lonmin, latmax, latmin, start, end),
+            ).fetchall()
+        removed = [
+            (uid, productType, filters) for uid, feature in stored
+            if shape(json.loads(feature)['geometry']).intersects(box)
+        ]
+
+        rows = []
+        for product in results:
+            props = product.properties
+            p_start = _timestamp(props.get('startTimeFromAscendingNode') or _isoformat(start))
+            p_end = _timestamp(props.get('completionTimeFromAscendingNode') or _isoformat(p_start))
+            rows.append((
+                props.get('uid') or props['id'], productType, filters, *product.geometry.bounds,
+                p_start, p_end, json.dumps(product.as_dict(), default=str),
+            ))
+        with self._connect() as conn:
+            conn.executemany('DELETE FROM products WHERE uid = ? AND product_type = ? AND filters = ?', removed)
+            conn.executemany('INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            conn.execute(
+                'INSERT INTO coverage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (productType, filters, lonmin, latmin, lonmax, latmax, start, end, time.time()),
+            )
+        return results
+
+    def _compact(self, productType, filters, query, fetched_at):
+        """
+        Replace the coverage records inside a fully searched box by the box
+
+        The new record keeps the oldest fetch time of the records it was
+        assembled from, so overlapping searches leave one record each instead
+        of one per fetched piece, at the cost of refetching the whole box
+        once its oldest part is stale.
+        """
+        lonmin, latmin, start, lonmax, latmax, end = query
+        with self._connect() as conn:
+            conn.execute(
+                """
+                DELETE FROM coverage
+                WHERE product_type = ? AND filters = ?
+                    AND minx >= ? AND miny >= ? AND start >= ? AND maxx <= ? AND maxy <= ? AND end <= ?
+                """,
+                (productType, filters, *query),
+            )
+            conn.execute(
+                'INSERT INTO coverage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (productType, filters, lonmin, latmin, lonmax, latmax, start, end, fetched_at),
+            )
+
+    def search(self, productType, start, end, geom, **kwargs):
+        """
+        Search products, fetching remotely only what is not fresh locally
+
+        Args:
+            productType (str): Product type searched
+            start (str): Start of the time window, ISO 8601
+            end (str): End of the time window, ISO 8601
+            geom: Search area, in any form accepted by ``dag.search()``
+            **kwargs: Additional search criteria
+
+        Returns:
+            SearchResult: All products matching the search
+        """
+        query, pieces, fetched_at = self._plan(productType, start, end, geom, **kwargs)
+        filters = json.dumps(kwargs, sort_keys=True, default=str)
+        if pieces:
+            logger.info(f"Fetching {len(pieces)} uncovered part(s) of the {productType} search remotely")
+        else:
+            logger.info(f"{productType} search answered locally")
+
+        remote = [product for piece in pieces for product in self._fetch(productType, filters, piece, **kwargs)]
+        if pieces and pieces != [query]:
+            self._compact(productType, filters, query, fetched_at)
+
+        search_geometry = get_geometry_from_various(geometry=geom)
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT feature FROM products
+                WHERE product_type = ? AND filters = ?
+                    AND minx <= ? AND maxx >= ? AND miny <= ? AND maxy >= ? AND start >= ? AND start <= ?
+                """,
+                (productType, filters, query[3], query[0], query[4], query[1], query[2], query[5]),
+            ).fetchall()
+
+        products = {}
+        for product in remote:
+            if product.geometry.intersects(search_geometry):
+                products[product.properties.get('uid') or product.properties['id']] = product
+        for (feature,) in rows:
+            feature = json.loads(feature)
+            uid = feature['properties'].get('uid') or feature['id']
+            if uid in products or not shape(feature['geometry']).intersects(search_geometry):
+                continue
+            products[uid] = register_product(self.dag, EOProduct.from_geojson(feature))
+        return SearchResult(list(products.values()), number_matched=len(products))
+
+    def prune(self):
+        """
+        Remove stale coverage records and the products outside fresh coverage
+
+        Returns:
+            tuple: Number of removed coverage records and products
+        """
+        with self._connect() as conn:
+            coverage = conn.execute('DELETE FROM coverage WHERE fetched_at < ?', (time.time() - self.max_age,))
+            products = conn.execute(
+                """
+                DELETE FROM products WHERE NOT EXISTS (
+                    SELECT 1 FROM coverage AS c
+                    WHERE c.product_type = products.product_type AND c.filters = products.filters
+                        AND c.minx <= products.maxx AND c.maxx >= products.minx
+                        AND c.miny <= products.maxy AND c.maxy >= products.miny
+                        AND c.start <= products.start AND c.end >= products.start
+                )
+                """
+            )
+        return coverage.rowcount, products.rowcount
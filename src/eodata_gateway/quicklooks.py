@@ -0,0 +1,244 @@
+"""
+Concurrent quicklook prefetching into a size-bounded local cache for eodata-gateway
+"""
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are optional
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'eodata_gateway', 'quicklooks')
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_TIMEOUT = 60
+
+
+class QuicklookCache:
+    """
+    On-disk quicklook cache evicting the least recently used images
+
+    Room is made before each new image is stored, so the cache stays within
+    max_bytes while a batch is being fetched, except for the images the
+    caller asks to keep.
+
+    Args:
+        cache_dir (str): Directory where images are stored
+        max_bytes (int): Maximum total size of the cache
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Size of the cache as of the last scan plus the images stored since
+        self._size = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key, suffix='quicklook'):
+        """
+        Get the cache path of an image
+
+        Args:
+            key (str): Product identifier
+            suffix (str): Image kind, 'quicklook' or a thumbnail size
+
+        Returns:
+            str: Path of the cached image
+        """
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.{suffix}")
+
+    def get(self, key, suffix='quicklook'):
+        """
+        Get a cached image, marking it as recently used
+
+        Args:
+            key (str): Product identifier
+            suffix (str): Image kind, 'quicklook' or a thumbnail size
+
+        Returns:
+            str: Path of the cached image, or None on cache miss
+        """
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, content, suffix='quicklook', keep=()):
+        """
+        Store an image in the cache, evicting older images first if needed
+
+        Args:
+            key (str): Product identifier
+            content (bytes): Image content
+            suffix (str): Image kind, 'quicklook' or a thumbnail size
+            keep (collection, optional): Paths that must not be evicted
+
+        Returns:
+            str: Path of the cached image
+        """
+        with self._lock:
+            full = self._size is None or self._size + len(content) > self.max_bytes
+        if full:
+            self.evict(keep=keep, incoming=len(content))
+
+        path = self.path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += len(content)
+        return path
+
+    def evict(self, keep=(), incoming=0):
+        """
+        Remove least recently used images until the cache fits in max_bytes
+
+        Args:
+            keep (collection, optional): Paths that must not be evicted, e.g.
+                the images of a batch being fetched
+            incoming (int): Size in bytes of an image about to be stored
+
+        Returns:
+            int: Number of removed images
+        """
+        with self._lock:
+            entries = []
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith('.tmp'):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total + incoming <= self.max_bytes:
+                    break
+                if path in keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            if total + incoming > self.max_bytes:
+                logger.warning(f"Quicklook cache exceeds {self.max_bytes} bytes with the images kept")
+            self._size = total
+            return removed
+
+
+def _product_key(product):
+    return product.properties.get('uid') or product.properties['id']
+
+
+def _make_thumbnail(source_path, size):
+    """Downscale an image to fit in a size x size square, returning PNG bytes"""
+    with Image.open(source_path) as image:
+        image.thumbnail((size, size))
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _fetch_quicklook(product, cache, session, auth, thumbnail_size, timeout, keep):
+    """
+    Get the quicklook of a product from the cache, downloading it on miss
+
+    Paths are added to keep so that storing the images of the other products
+    of the batch does not evict them.
+    """
+    key = _product_key(product)
+    keep.add(cache.path(key))
+    path = cache.get(key)
+    if path is None:
+        url = product.properties.get('quicklook') or product.properties.get('thumbnail')
+        if not url:
+            return key, None, None
+        response = session.get(url, auth=auth, timeout=timeout)
+        response.raise_for_status()
+        path = cache.put(key, response.content, keep=keep)
+
+    thumbnail_path = None
+    if thumbnail_size:
+        suffix = f"thumb{thumbnail_size}"
+        keep.add(cache.path(key, suffix))
+        thumbnail_path = cache.get(key, suffix)
+        if thumbnail_path is None:
+            thumbnail_path = cache.put(key, _make_thumbnail(path, thumbnail_size), suffix, keep=keep)
+    return key, path, thumbnail_path
+
+
+def prefetch_quicklooks(products, cache=None, max_workers=DEFAULT_MAX_WORKERS,
+                        thumbnail_size=None, auth=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Download the quicklooks of many products concurrently into a local cache
+
+    Images already cached are served without any request. Thumbnails, when
+    requested, are produced from the quicklook in the same pass. Older images
+    are evicted as new ones are stored, but never the images of this batch,
+    so every returned path stays valid even if the batch alone exceeds the
+    cache size.
+
+    Args:
+        products (iterable of EOProduct): Products, e.g. a SearchResult
+        cache (QuicklookCache, optional): Cache to use, the default cache if None
+        max_workers (int): Number of concurrent downloads
+        thumbnail_size (int, optional): Size in pixels of thumbnails to produce
+            (requires Pillow)
+        auth (requests.auth.AuthBase, optional): Authentication for the requests
+        timeout (int): Request timeout in seconds
+
+    Returns:
+        dict: Product identifiers mapped to {'quicklook': path, 'thumbnail': path},
+            with None paths for products whose quicklook is unavailable
+    """
+    cache = cache or QuicklookCache()
+    if thumbnail_size and Image is None:
+        logger.warning("Pillow is not installed, thumbnails will not be produced")
+        thumbnail_size = None
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    results = {}
+    keep = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_fetch_quicklook, product, cache, session, auth, thumbnail_size, timeout, keep): product
+            for product in products
+        }
+        for future, product in futures.items():
+            try:
+                key, path, thumbnail_path = future.result()
+            except (requests.RequestException, OSError) as e:
+                key, path, thumbnail_path = _product_key(product), None, None
+                logger.warning(f"Could not fetch quicklook of {key}: {e}")
+            results[key] = {'quicklook': path, 'thumbnail': thumbnail_path}
+
+    # Images of earlier batches kept beyond max_bytes can go now
+    cache.evict(keep=keep)
+    return results
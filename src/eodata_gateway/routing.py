@@ -0,0 +1,256 @@
+"""
+Latency-aware multi-provider search routing for eodata-gateway
+
+Instead of a single preferred provider, searches go to the currently fastest
+healthy provider for the requested product type. Rolling latency and error
+statistics are kept per provider and product type; a provider failing
+repeatedly is put aside for a cooldown period and the next one is tried
+automatically. Optionally, the two best providers are raced and the first
+complete answer wins.
+
+eodag search plugins keep per-search state, so each provider runs one search
+at a time. A provider still busy with the losing search of a race ranks after
+idle ones.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from eodag.api.search_result import SearchResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDERS = ('cop_dataspace_opensearch', 'cop_dataspace')
+DEFAULT_WINDOW = 20
+DEFAULT_MAX_ERROR_RATE = 0.5
+DEFAULT_MIN_SAMPLES = 5
+DEFAULT_MAX_CONSECUTIVE_ERRORS = 3
+DEFAULT_COOLDOWN = 60
+
+
+class ProviderStats:
+    """
+    Rolling latency and error statistics of a provider for one product type
+
+    Args:
+        window (int): Number of recent searches taken into account
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.consecutive_errors = 0
+        self.last_error_at = None
+
+    def record(self, latency, ok):
+        """
+        Record the outcome of a search
+
+        Args:
+            latency (float): Duration of the search in seconds
+            ok (bool): Whether the search succeeded
+        """
+        self.samples.append((latency, ok))
+        if ok:
+            self.consecutive_errors = 0
+        else:
+            self.consecutive_errors += 1
+            self.last_error_at = time.monotonic()
+
+    @property
+    def latency(self):
+        """Median latency of successful searches, 0 if none was recorded"""
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        return latencies[len(latencies) // 2] if latencies else 0.0
+
+    @property
+    def error_rate(self):
+        """Fraction of failed searches in the window"""
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+
+def deduplicate(products):
+    """
+    Normalize search results from several providers into one SearchResult
+
+    Providers expose the same product under different ``uid`` values, so
+    products are matched on their title first and ``uid`` otherwise; the
+    first occurrence is kept.
+
+    Args:
+        products (iterable of EOProduct): Products to normalize
+
+    Returns:
+        SearchResult: Products without duplicates
+    """
+    seen = set()
+    unique = []
+    for product in products:
+        key = product.properties.get('title') or product.properties.get('uid') or product.properties.get('id')
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(product)
+    return SearchResult(unique, number_matched=getattr(products, 'number_matched', None))
+
+
+class ProviderRouter:
+    """
+    Route searches to the fastest healthy provider, failing over automatically
+
+    Args:
+        dag (EODataAccessGateway): Gateway where all providers are configured
+        providers (list): Candidate providers
+        race (bool): Race the two best providers and keep the first answer
+        window (int): Number of recent searches used for statistics
+        max_error_rate (float): Error rate above which a provider is unhealthy
+        min_samples (int): Number of recorded searches needed before the
+            error rate can mark a provider unhealthy
+        max_consecutive_errors (int): Consecutive errors putting a provider
+            aside for the cooldown period
+        cooldown (float): Seconds an unhealthy provider is skipped before
+            being tried again
+    """
+
+    def __init__(self, dag, providers=DEFAULT_PROVIDERS, race=False, window=DEFAULT_WINDOW,
+                 max_error_rate=DEFAULT_MAX_ERROR_RATE, min_samples=DEFAULT_MIN_SAMPLES,
+                 max_consecutive_errors=DEFAULT_MAX_CONSECUTIVE_ERRORS, cooldown=DEFAULT_COOLDOWN):
+        self.dag = dag
+        self.providers = list(providers)
+        self.race = race
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.max_consecutive_errors = max_consecutive_errors
+        self.cooldown = cooldown
+        self.stats = defaultdict(lambda: ProviderStats(window))
+        self._lock = threading.Lock()
+        self._provider_locks = {provider: threading.Lock() for provider in self.providers}
+        # Losing racers keep running in the background after the winner
+        # returns, at most one per provider
+        self._executor = ThreadPoolExecutor(max_workers=len(self.providers))
+
+    def close(self):
+        """Wait for the searches still running in the background and release their threads"""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _healthy(self, stats):
+        unhealthy = (
+            stats.consecutive_errors >= self.max_consecutive_errors
+            or (len(stats.samples) >= self.min_samples and stats.error_rate > self.max_error_rate)
+        )
+        return not unhealthy or time.monotonic() - stats.last_error_at > self.cooldown
+
+    def ranked_providers(self, product_type):
+        """
+        Order candidate providers for a product type
+
+        Healthy providers come first, fastest first; providers without
+        statistics yet rank as fastest so they get measured. Unhealthy
+        providers are kept last as a final fallback.
+
+        Args:
+            product_type (str): Product type searched
+
+        Returns:
+            list: Provider names, best first
+        """
+        with self._lock:
+            stats = {provider: self.stats[(provider, product_type)] for provider in self.providers}
+            return sorted(
+                self.providers,
+                key=lambda provider: (not self._healthy(stats[provider]), stats[provider].latency),
+            )
+
+    def _search(self, provider, product_type, **kwargs):
+        """Search on one provider, recording latency and outcome"""
+        with self._provider_locks[provider]:
+            start = time.monotonic()
+            try:
+                results = self.dag.search(provider=provider, productType=product_type, raise_errors=True, **kwargs)
+            except Exception:
+                with self._lock:
+                    self.stats[(provider, product_type)].record(time.monotonic() - start, False)
+                raise
+        with self._lock:
+            self.stats[(provider, product_type)].record(time.monotonic() - start, True)
+        return results
+
+    def search(self, productType, race=None, **kwargs):
+        """
+        Search on the best provider for a product type
+
+        Args:
+            productType (str): Product type to search
+            race (bool, optional): Override the router race setting
+            **kwargs: Other search criteria passed to ``dag.search()``
+
+        Returns:
+            SearchResult: Deduplicated products of the first successful provider
+
+        Raises:
+            RequestError: If every provider failed, the last error
+        """
+        # Providers still running a search, e.g. a race loser, would make this one wait
+        ranked = sorted(
+            self.ranked_providers(productType), key=lambda provider: self._provider_locks[provider].locked()
+        )
+        race = self.race if race is None else race
+        errors = []
+
+        # Only idle providers are raced, a busy one would hold an executor thread waiting
+        idle = [provider for provider in ranked if not self._provider_locks[provider].locked()]
+        if race and len(idle) > 1:
+            pending = {
+                self._executor.submit(self._search, provider, productType, **kwargs): provider
+                for provider in ranked[:2]
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider = pending.pop(future)
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        logger.warning(f"Search on {provider} failed: {e}")
+                        errors.append((provider, e))
+                    else:
+                        logger.debug(f"{provider} won the race for {productType}")
+                        return deduplicate(results)
+            ranked = ranked[2:]
+
+        for provider in ranked:
+            try:
+                return deduplicate(self._search(provider, productType, **kwargs))
+            except Exception as e:
+                logger.warning(f"Search on {provider} failed, failing over: {e}")
+                errors.append((provider, e))
+
+        if errors:
+            raise errors[-1][1]
+        return SearchResult([])
+
+    def report(self):
+        """
+        Summarize the statistics of every provider and product type
+
+        Returns:
+            dict: (provider, product type) mapped to latency, error rate and health
+        """
+        with self._lock:
+            return {
+                key: {
+                    'latency': stats.latency,
+                    'error_rate': stats.error_rate,
+                    'healthy': self._healthy(stats),
+                }
+                for key, stats in self.stats.items()
+            }
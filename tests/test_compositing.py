@@ -0,0 +1,117 @@
+"""
+Tests of the chunked temporal compositing engine on .npy stacks
+"""
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from eodata_gateway import compositing
+from eodata_gateway.compositing import composite
+
+REDUCTIONS = {'mean': np.nanmean, 'median': np.nanmedian, 'max': np.nanmax}
+
+
+@pytest.fixture(autouse=True)
+def spawn_workers(monkeypatch):
+    """Spawn workers, forking the multi-threaded test process may deadlock"""
+    monkeypatch.setattr(
+        compositing, 'ProcessPoolExecutor',
+        functools.partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context('spawn')),
+    )
+
+
+@pytest.fixture
+def stack(tmp_path):
+    """Five 2-band 7x5 rasters, with NaN gaps and a pixel without any valid value"""
+    rng = np.random.default_rng(31)
+    arrays = rng.uniform(0, 100, size=(5, 2, 7, 5)).astype(np.float32)
+    arrays[rng.uniform(size=arrays.shape) < 0.3] = np.nan
+    arrays[:, :, 6, 4] = np.nan
+    paths = []
+    for index, array in enumerate(arrays):
+        paths.append(str(tmp_path / f'source{index}.npy'))
+        np.save(paths[-1], array)
+    return paths, arrays
+
+
+def expected(arrays, method):
+    with pytest.warns(RuntimeWarning):
+        return REDUCTIONS[method](arrays, axis=0)
+
+
+@pytest.mark.parametrize('method', ['mean', 'median', 'max'])
+def test_composite_matches_nan_reductions(stack, tmp_path, method):
+    paths, arrays = stack
+    # Tiles of 3 px leave partial tiles on both edges of the 7x5 rasters
+    result = composite(paths, str(tmp_path / 'out.npy'), method=method, tile_size=3, max_workers=2)
+    assert result.shape == (2, 7, 5)
+    np.testing.assert_allclose(result, expected(arrays, method), rtol=1e-6)
+    assert np.isnan(result[:, 6, 4]).all()
+
+
+def test_nodata_values_are_ignored(tmp_path):
+    paths = []
+    for index, value in enumerate([1, -9999, 3]):
+        paths.append(str(tmp_path / f'source{index}.npy'))
+        np.save(paths[-1], np.full((4, 4), value, dtype=np.int16))
+    result = composite(paths, str(tmp_path / 'out.npy'), method='mean', nodata=-9999, max_workers=1)
+    assert result.shape == (1, 4, 4)
+    assert (result == 2).all()
+
+
+@pytest.mark.filterwarnings('ignore:All-NaN slice')
+def test_median_tiles_shrink_to_memory_budget(stack, tmp_path, monkeypatch):
+    paths, arrays = stack
+    # 5 rasters x 2 bands x 4 bytes: 160 bytes hold a 2x2 stack
+    assert compositing._tile_size(512, 'median', 5, 2, 160) == 2
+    assert compositing._tile_size(512, 'mean', 5, 2, 160) == 512
+
+    tiles = []
+    read_tile = compositing._read_tile
+    monkeypatch.setattr(compositing, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(
+        compositing, '_read_tile',
+        lambda path, row, col, height, width, nodata: tiles.append((height, width)) or read_tile(
+            path, row, col, height, width, nodata
+        ),
+    )
+    result = composite(paths, str(tmp_path / 'out.npy'), method='median', max_tile_bytes=160, max_workers=2)
+    assert max(tiles) == (2, 2)
+    np.testing.assert_allclose(result, expected(arrays, 'median'), rtol=1e-6)
+
+
+def test_pending_tiles_are_bounded(stack, tmp_path, monkeypatch):
+    paths, arrays = stack
+    lock = threading.Lock()
+    counts = {'pending': 0, 'peak': 0}
+
+    def finished(future):
+        with lock:
+            counts['pending'] -= 1
+
+    class CountingExecutor(ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            with lock:
+                counts['pending'] += 1
+                counts['peak'] = max(counts['peak'], counts['pending'])
+            future = super().submit(*args, **kwargs)
+            future.add_done_callback(finished)
+            return future
+
+    monkeypatch.setattr(compositing, 'ProcessPoolExecutor', CountingExecutor)
+    result = composite(paths, str(tmp_path / 'out.npy'), method='max', tile_size=1, max_workers=2)
+    assert counts['peak'] <= 2 * compositing._TILES_PER_WORKER
+    np.testing.assert_allclose(result, expected(arrays, 'max'), rtol=1e-6)
+
+
+def test_rejects_mismatching_sources(stack, tmp_path):
+    paths, _ = stack
+    np.save(tmp_path / 'other.npy', np.zeros((3, 3), dtype=np.float32))
+    with pytest.raises(ValueError):
+        composite(paths + [str(tmp_path / 'other.npy')], str(tmp_path / 'out.npy'))
+    with pytest.raises(ValueError):
+        composite(paths, str(tmp_path / 'out.npy'), method='min')
@@ -0,0 +1,70 @@
+"""
+Tests of count-only queries against a mocked resto endpoint
+"""
+import re
+
+import pytest
+
+from eodata_gateway.counting import ProductCounter, month_bins
+
+RESTO_URL = re.compile(r'https://catalogue\.dataspace\.copernicus\.eu/resto/api/collections/.*/search\.json')
+
+
+@pytest.fixture
+def queries(requests_mock):
+    queries = []
+
+    def respond(request, context):
+        queries.append(request.qs)
+        return {'type': 'FeatureCollection', 'properties': {'totalResults': 7}, 'features': []}
+
+    requests_mock.get(RESTO_URL, json=respond)
+    return queries
+
+
+def test_month_bins():
+    assert month_bins('2023-11-15', '2024-02-01') == [
+        ('2023-11-15', '2023-12-01'), ('2023-12-01', '2024-01-01'), ('2024-01-01', '2024-02-01'),
+    ]
+
+
+def test_adjacent_bins_do_not_overlap(queries):
+    ProductCounter(max_workers=1).histogram(['S2_MSI_L2A'], '2023-12-15', '2024-03-01')
+    windows = sorted((query['startdate'][0], query['completiondate'][0]) for query in queries)
+    assert windows == [
+        ('2023-12-15t00:00:00.000z', '2023-12-31t23:59:59.999z'),
+        ('2024-01-01t00:00:00.000z', '2024-01-31t23:59:59.999z'),
+        ('2024-02-01t00:00:00.000z', '2024-02-29t23:59:59.999z'),
+    ]
+    assert all(previous[1] < following[0] for previous, following in zip(windows, windows[1:]))
+
+
+def test_count_asks_for_one_record(queries):
+    assert ProductCounter().count('S2_MSI_L2A', '2024-01-01', '2024-02-01', geom=[0, 0, 1, 1]) == 7
+    (query,) = queries
+    assert query['maxrecords'] == ['1'] and query['producttype'] == ['s2msi2a']
+    assert 'geometry' in query
+
+
+def test_histogram_filters_tiled_products_on_tile_id(queries):
+    counts = ProductCounter().histogram(['S2_MSI_L2A'], '2024-01-01', '2024-03-01', tiles=['31TCJ', 'T31TCH'])
+    assert counts == {
+        ('S2_MSI_L2A', '2024-01-01', '31TCJ'): 7, ('S2_MSI_L2A', '2024-02-01', '31TCJ'): 7,
+        ('S2_MSI_L2A', '2024-01-01', 'T31TCH'): 7, ('S2_MSI_L2A', '2024-02-01', 'T31TCH'): 7,
+    }
+    assert sorted(query['tileid'][0] for query in queries) == ['31tch', '31tch', '31tcj', '31tcj']
+    assert not any('geometry' in query for query in queries)
+
+
+def test_histogram_filters_other_products_on_geometry(queries):
+    tiles = {'north': [0, 1, 1, 2], 'south': [0, 0, 1, 1]}
+    counts = ProductCounter().histogram(['S1_SAR_GRD', 'S2_MSI_L2A'], '2024-01-01', '2024-02-01', tiles=tiles)
+    assert len(counts) == 4
+    s1_queries = [query for query in queries if query['producttype'] == ['grd']]
+    assert len(s1_queries) == 2 and all('geometry' in query and 'tileid' not in query for query in s1_queries)
+
+
+def test_histogram_needs_geometries_for_untiled_products(queries):
+    with pytest.raises(ValueError):
+        ProductCounter().histogram(['S1_SAR_GRD'], '2024-01-01', '2024-02-01', tiles=['31TCJ'])
+    assert not queries
@@ -0,0 +1,84 @@
+"""
+Tests of request coalescing and search locking of the gateway service
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from eodag.api.search_result import SearchResult
+
+from eodata_gateway.daemon import GatewayService, RequestCoalescer
+
+
+def test_concurrent_identical_requests_share_one_call():
+    coalescer = RequestCoalescer(ttl=60)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return 42
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(executor.map(lambda _: coalescer.run('key', compute), range(5)))
+    assert results == [42] * 5
+    assert len(calls) == 1
+
+
+def test_expired_results_are_dropped():
+    coalescer = RequestCoalescer(ttl=0.05)
+    for index in range(10):
+        coalescer.run(f'key{index}', lambda: index)
+    assert len(coalescer._futures) == 10
+    time.sleep(0.1)
+    coalescer.run('other', lambda: None)
+    assert list(coalescer._futures) == ['other']
+
+
+def test_errors_are_not_kept():
+    coalescer = RequestCoalescer(ttl=60)
+
+    def fail():
+        raise ValueError('boom')
+
+    for _ in range(2):
+        try:
+            coalescer.run('key', fail)
+        except ValueError:
+            pass
+    assert coalescer._futures == {}
+
+
+class SlowGateway:
+    """Gateway stub recording how many searches run at once per provider"""
+
+    def __init__(self):
+        self.running = {}
+        self.max_running = {}
+        self.lock = threading.Lock()
+
+    def get_preferred_provider(self):
+        return 'preferred', 1
+
+    def search(self, provider, **criteria):
+        with self.lock:
+            self.running[provider] = self.running.get(provider, 0) + 1
+            self.max_running[provider] = max(self.max_running.get(provider, 0), self.running[provider])
+        time.sleep(0.1)
+        with self.lock:
+            self.running[provider] -= 1
+        return SearchResult([])
+
+
+def test_searches_are_serialized_per_provider():
+    dag = SlowGateway()
+    service = GatewayService(dag=dag, counter=object(), ttl=0)
+    criteria = [{'productType': f'type{index}'} for index in range(3)]
+    criteria += [{'productType': f'type{index}', 'provider': 'other'} for index in range(3)]
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(service.search, criteria))
+    assert dag.max_running == {'preferred': 1, 'other': 1}
+    # Both providers progress at the same time
+    assert time.monotonic() - start < 0.55
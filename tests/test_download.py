@@ -0,0 +1,100 @@
+"""
+Tests of verified streaming downloads
+"""
+import hashlib
+import io
+import os
+import zipfile
+
+import pytest
+from eodag.api.product import EOProduct
+
+from eodata_gateway import download
+from eodata_gateway.download import ChecksumMismatchError, download_product, stream_download
+from eodata_gateway.gateway import create_slim_gateway
+
+URL = 'https://download.test/product'
+
+
+def make_archive():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('S2A_TEST.SAFE/manifest.safe', 'manifest')
+        archive.writestr('S2A_TEST.SAFE/GRANULE/B04.jp2', 'band')
+    return buffer.getvalue()
+
+
+ARCHIVE = make_archive()
+MD5 = hashlib.md5(ARCHIVE).hexdigest()
+
+
+def test_stream_download_verifies(requests_mock, tmp_path):
+    requests_mock.get(URL, content=ARCHIVE)
+    path = stream_download(URL, str(tmp_path / 'a.zip'), [{'Algorithm': 'MD5', 'Value': MD5.upper()}])
+    with open(path, 'rb') as f:
+        assert f.read() == ARCHIVE
+    assert not os.path.exists(f'{path}.part')
+
+
+def test_stream_download_retries_then_fails(requests_mock, tmp_path):
+    requests_mock.get(URL, [{'content': b'corrupted'}, {'content': ARCHIVE}])
+    assert stream_download(URL, str(tmp_path / 'a.zip'), {'md5': MD5})
+
+    requests_mock.get(URL, content=b'corrupted')
+    with pytest.raises(ChecksumMismatchError):
+        stream_download(URL, str(tmp_path / 'b.zip'), {'md5': MD5}, max_retries=1)
+    assert os.listdir(tmp_path) == ['a.zip']
+
+
+@pytest.fixture(scope='module')
+def dag():
+    return create_slim_gateway()
+
+
+@pytest.fixture
+def product(dag):
+    product = EOProduct('cop_dataspace_opensearch', {
+        'id': 'uid', 'title': 'S2A_TEST', 'geometry': 'POINT (0 0)', 'downloadLink': URL,
+    }, productType='S2_MSI_L2A')
+    product.register_downloader(dag._plugins_manager.get_download_plugin(product), None)
+    return product
+
+
+def test_download_product_extracts_verified_archive(requests_mock, tmp_path, product):
+    requests_mock.get(URL, content=ARCHIVE)
+    path = download_product(product, outputs_prefix=str(tmp_path), checksums={'md5': MD5})
+    assert path == str(tmp_path / 'S2A_TEST')
+    # archive_depth 2 of the provider configuration strips the .SAFE directory
+    assert sorted(os.listdir(path)) == ['GRANULE', 'manifest.safe']
+    assert not os.path.exists(tmp_path / 'S2A_TEST.zip')
+    assert product.location == f'file://{path}'
+
+
+def test_download_product_keeps_archive_without_extraction(requests_mock, tmp_path, product):
+    requests_mock.get(URL, content=ARCHIVE)
+    path = download_product(product, outputs_prefix=str(tmp_path), checksums={'md5': MD5}, extract=False)
+    assert path == str(tmp_path / 'S2A_TEST.zip')
+
+
+def test_already_downloaded_product_skips_requests(requests_mock, tmp_path, product, monkeypatch):
+    os.makedirs(tmp_path / 'S2A_TEST')
+    (tmp_path / 'S2A_TEST' / 'manifest.safe').write_text('manifest')
+    monkeypatch.setattr(download, 'get_product_checksums', lambda *args, **kwargs: pytest.fail('checksum lookup'))
+    assert download_product(product, outputs_prefix=str(tmp_path)) == str(tmp_path / 'S2A_TEST')
+    assert not requests_mock.called
+
+
+def test_existing_archive_is_verified_before_extraction(requests_mock, tmp_path, product):
+    (tmp_path / 'S2A_TEST.zip').write_bytes(ARCHIVE)
+    path = download_product(product, outputs_prefix=str(tmp_path), checksums={'md5': MD5})
+    assert sorted(os.listdir(path)) == ['GRANULE', 'manifest.safe']
+    assert not requests_mock.called
+
+
+def test_truncated_archive_is_downloaded_again(requests_mock, tmp_path, product):
+    # Left by an interrupted unverified download
+    (tmp_path / 'S2A_TEST.zip').write_bytes(ARCHIVE[:len(ARCHIVE) // 2])
+    requests_mock.get(URL, content=ARCHIVE)
+    path = download_product(product, outputs_prefix=str(tmp_path), checksums={'md5': MD5})
+    assert sorted(os.listdir(path)) == ['GRANULE', 'manifest.safe']
+    assert requests_mock.call_count == 1
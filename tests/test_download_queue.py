@@ -0,0 +1,117 @@
+"""
+Tests of the leasing, expiry and dead-letter logic of the download queue
+"""
+import sqlite3
+import time
+
+import pytest
+from eodag.api.product import EOProduct
+
+from eodata_gateway.download_queue import DEAD, DONE, LEASED, PENDING, DownloadQueue
+
+
+def make_products(*ids):
+    return [
+        EOProduct('cop_dataspace_opensearch', {'id': uid, 'title': uid, 'geometry': 'POINT (0 0)'},
+                  productType='S2_MSI_L2A')
+        for uid in ids
+    ]
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return DownloadQueue(str(tmp_path / 'queue.db'), lease_seconds=60, max_attempts=3, retry_delay=0)
+
+
+def test_enqueue_ignores_duplicates(queue):
+    assert queue.enqueue(make_products('a', 'b')) == 2
+    assert queue.enqueue(make_products('b', 'c')) == 1
+    assert queue.stats() == {PENDING: 3, LEASED: 0, DONE: 0, DEAD: 0}
+
+
+def test_lease_is_exclusive(queue):
+    queue.enqueue(make_products('a', 'b'))
+    first = queue.lease('w1')
+    second = queue.lease('w2')
+    assert {first['uid'], second['uid']} == {'a', 'b'}
+    assert queue.lease('w3') is None
+    assert first['lease_owner'] == 'w1' and first['attempts'] == 1
+
+
+def test_complete_only_by_lease_owner(queue):
+    queue.enqueue(make_products('a'))
+    job = queue.lease('w1')
+    queue.complete(job['id'], 'w2', '/elsewhere')
+    assert queue.stats()[LEASED] == 1
+    queue.complete(job['id'], 'w1', '/downloads/a')
+    assert queue.stats()[DONE] == 1
+    assert queue.lease('w1') is None
+
+
+def test_expired_lease_is_taken_over(queue):
+    queue.enqueue(make_products('a'))
+    job = queue.lease('w1')
+    queue.lease_seconds = -1
+    assert queue.heartbeat(job['id'], 'w1')
+
+    taken = queue.lease('w2')
+    assert taken['id'] == job['id'] and taken['lease_owner'] == 'w2' and taken['attempts'] == 2
+    assert not queue.heartbeat(job['id'], 'w1')
+
+
+def test_heartbeat_extends_lease(queue):
+    queue.enqueue(make_products('a'))
+    job = queue.lease('w1')
+    assert queue.heartbeat(job['id'], 'w1')
+    assert queue.lease('w2') is None
+
+
+def test_fail_backs_off_then_dead_letters(queue):
+    queue.retry_delay = 3600
+    queue.enqueue(make_products('a'))
+    job = queue.lease('w1')
+    queue.fail(job['id'], 'w1', 'boom')
+    assert queue.stats()[PENDING] == 1
+    # Not available before the retry delay
+    assert queue.lease('w1') is None
+
+    queue.retry_delay = 0
+    for _ in range(queue.max_attempts - 1):
+        with sqlite3.connect(queue.path) as conn:
+            conn.execute('UPDATE jobs SET available_at = 0')
+        job = queue.lease('w1')
+        queue.fail(job['id'], 'w1', 'boom')
+    assert queue.stats()[DEAD] == 1
+    assert queue.lease('w1') is None
+
+    assert queue.retry_dead() == 1
+    assert queue.lease('w1')['attempts'] == 1
+
+
+def test_expired_leases_dead_letter_after_max_attempts(queue):
+    queue.enqueue(make_products('a'))
+    queue.lease_seconds = -1
+    for attempt in range(queue.max_attempts):
+        assert queue.lease(f'w{attempt}') is not None
+    assert queue.lease('last') is None
+    assert queue.stats()[DEAD] == 1
+
+
+@pytest.mark.parametrize('multi_node, journal_mode', [(False, 'wal'), (True, 'delete')])
+def test_journal_mode(tmp_path, multi_node, journal_mode):
+    queue = DownloadQueue(str(tmp_path / 'queue.db'), multi_node=multi_node)
+    queue.enqueue(make_products('a'))
+    with queue._connect() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == journal_mode
+
+
+def test_retry_schedule(queue):
+    queue.retry_delay = 10
+    queue.enqueue(make_products('a'))
+    job = queue.lease('w1')
+    before = time.time()
+    queue.fail(job['id'], 'w1', 'boom')
+    with sqlite3.connect(queue.path) as conn:
+        available_at, last_error = conn.execute('SELECT available_at, last_error FROM jobs').fetchone()
+    assert before + 10 <= available_at <= time.time() + 10
+    assert last_error == 'boom'
@@ -0,0 +1,90 @@
+"""
+Tests of the partitioned GeoParquet export
+"""
+import json
+import os
+from datetime import date, timedelta
+
+import pytest
+import shapely
+from eodag.api.product import EOProduct
+from eodag.api.search_result import SearchResult
+
+pa = pytest.importorskip('pyarrow')
+pc = pytest.importorskip('pyarrow.compute')
+pq = pytest.importorskip('pyarrow.parquet')
+
+from eodata_gateway.export import export_geoparquet, read_geoparquet  # noqa: E402
+
+
+def make_product(uid, day, product_type='S2_MSI_L2A', lon=0):
+    return EOProduct('cop_dataspace_opensearch', {
+        'id': uid, 'title': uid, 'geometry': f'POLYGON (({lon} 0, {lon + 1} 0, {lon + 1} 1, {lon} 1, {lon} 0))',
+        'startTimeFromAscendingNode': f'{day}T10:00:00Z', 'completionTimeFromAscendingNode': f'{day}T10:00:05Z',
+        'cloudCover': '12.5', 'orbitNumber': 42, 'snowCover': 3,
+    }, productType=product_type)
+
+
+def parquet_files(root_path):
+    return [os.path.join(root, name) for root, _, names in os.walk(root_path) for name in names]
+
+
+def test_round_trip(tmp_path):
+    products = [make_product('a', '2024-01-01'), make_product('b', '2024-01-02', lon=5)]
+    assert export_geoparquet(SearchResult(products), str(tmp_path)) == 2
+
+    table = read_geoparquet(str(tmp_path)).sort_by('uid')
+    assert table['uid'].to_pylist() == ['a', 'b']
+    assert table['product_type'].to_pylist() == ['S2_MSI_L2A', 'S2_MSI_L2A']
+    assert table['acquisition_date'].to_pylist() == ['2024-01-01', '2024-01-02']
+    assert table['cloudCover'].to_pylist() == [12.5, 12.5]
+    assert table['orbitNumber'].to_pylist() == [42, 42]
+    assert json.loads(table['properties'][0].as_py())['snowCover'] == 3
+    geometries = shapely.from_wkb(table['geometry'].to_pylist())
+    assert [geometry.equals(product.geometry) for geometry, product in zip(geometries, products)] == [True, True]
+
+
+def test_geo_metadata_describes_each_file(tmp_path):
+    export_geoparquet([make_product('a', '2024-01-01'), make_product('b', '2024-01-02', lon=5)], str(tmp_path))
+    bboxes = {}
+    for path in parquet_files(tmp_path):
+        geo = json.loads(pq.read_schema(path).metadata[b'geo'])
+        bboxes[os.path.basename(os.path.dirname(path))] = geo['columns']['geometry']['bbox']
+        assert geo['columns']['geometry']['geometry_types'] == ['Polygon']
+    assert bboxes == {
+        'acquisition_date=2024-01-01': [0.0, 0.0, 1.0, 1.0], 'acquisition_date=2024-01-02': [5.0, 0.0, 6.0, 1.0],
+    }
+
+
+def test_incremental_harvest_appends(tmp_path):
+    export_geoparquet([make_product('a', '2024-01-01')], str(tmp_path))
+    pages = iter([SearchResult([make_product('b', '2024-01-01')]), SearchResult([make_product('c', '2024-01-03')])])
+    assert export_geoparquet(pages, str(tmp_path), rows_per_file=1) == 2
+
+    assert sorted(read_geoparquet(str(tmp_path))['uid'].to_pylist()) == ['a', 'b', 'c']
+    assert len(parquet_files(tmp_path)) == 3
+
+
+def test_filter_prunes_partitions(tmp_path):
+    export_geoparquet([
+        make_product('a', '2024-01-01'), make_product('b', '2024-01-02'),
+        make_product('c', '2024-01-02', product_type='S1_SAR_GRD'),
+    ], str(tmp_path))
+    # Unreadable files outside the filtered partitions are never opened
+    with open(tmp_path / 'product_type=S1_SAR_GRD' / 'acquisition_date=2024-01-02' / 'broken.parquet', 'w') as f:
+        f.write('not parquet')
+
+    table = read_geoparquet(
+        str(tmp_path), columns=['uid'],
+        filter=(pc.field('product_type') == 'S2_MSI_L2A') & (pc.field('acquisition_date') == '2024-01-02'),
+    )
+    assert table['uid'].to_pylist() == ['b']
+
+
+def test_export_more_than_1024_partitions(tmp_path):
+    days = [(date(2021, 1, 1) + timedelta(days=offset)).isoformat() for offset in range(1100)]
+    products = [make_product(f'p{index}', day) for index, day in enumerate(days)]
+    assert export_geoparquet(products, str(tmp_path)) == 1100
+
+    table = read_geoparquet(str(tmp_path), columns=['acquisition_date'])
+    assert sorted(table['acquisition_date'].to_pylist()) == days
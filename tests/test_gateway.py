@@ -0,0 +1,61 @@
+"""
+Tests of the slim gateway configuration
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+import yaml
+
+from eodata_gateway import gateway
+
+
+@pytest.fixture(autouse=True)
+def slim_config_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(gateway, 'SLIM_CONFIG_DIR', str(tmp_path / 'slim'))
+    return tmp_path / 'slim'
+
+
+def _write_and_read(slim_config_dir):
+    gateway.SLIM_CONFIG_DIR = slim_config_dir
+    slim_dir = gateway._write_slim_config(['cop_dataspace'], ['S2_MSI_L2A'])
+    with open(os.path.join(slim_dir, 'providers.yml')) as f:
+        providers = f.read()
+    with open(os.path.join(slim_dir, 'product_types.yml')) as f:
+        return providers, yaml.safe_load(f)
+
+
+def test_slim_config_keeps_selection():
+    slim_dir = gateway._write_slim_config(['cop_dataspace'], ['S2_MSI_L2A'])
+    with open(os.path.join(slim_dir, 'providers.yml')) as f:
+        providers = f.read()
+    assert 'name: cop_dataspace\n' in providers
+    assert 'name: peps\n' not in providers
+    with open(os.path.join(slim_dir, 'product_types.yml')) as f:
+        product_types = yaml.safe_load(f)
+    # Product types of the bundled provider are kept as well
+    assert {'S2_MSI_L2A', 'S1_SAR_GRD', gateway.GENERIC_PRODUCT_TYPE} <= set(product_types)
+    assert 'CBERS4_PAN10M_L2' not in product_types
+    assert gateway._write_slim_config(['cop_dataspace'], ['S2_MSI_L2A']) == slim_dir
+    assert not [name for name in os.listdir(slim_dir) if name.startswith('.tmp-')]
+
+
+def test_concurrent_writers_never_expose_partial_files(slim_config_dir):
+    with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context('spawn')) as executor:
+        results = list(executor.map(_write_and_read, [str(slim_config_dir)] * 8))
+    assert all(result == results[0] for result in results)
+    assert 'S2_MSI_L2A' in results[0][1]
+
+
+def test_create_slim_gateway():
+    dag = gateway.create_slim_gateway()
+    assert dag.available_providers() == [gateway.DEFAULT_PROVIDER]
+    assert dag.get_preferred_provider()[0] == gateway.DEFAULT_PROVIDER
+    assert 'S2_MSI_L2A' in [product_type['ID'] for product_type in dag.list_product_types(fetch_providers=False)]
+
+
+def test_create_slim_gateway_with_bundled_provider():
+    dag = gateway.create_slim_gateway(providers=[gateway.DEFAULT_PROVIDER, 'cop_dataspace'])
+    assert sorted(dag.available_providers()) == sorted([gateway.DEFAULT_PROVIDER, 'cop_dataspace'])
+    assert dag.get_preferred_provider()[0] == gateway.DEFAULT_PROVIDER
@@ -0,0 +1,84 @@
+"""
+Tests of search geometry simplification and exact local refinement
+"""
+import math
+import random
+
+import pytest
+import shapely
+from eodag.api.product import EOProduct
+from eodag.api.search_result import SearchResult
+
+from eodata_gateway.geometry import refine, search_simplified, server_geometry
+
+
+def noisy_polygon(lon, lat, radius, vertices=2000, seed=0):
+    """Jagged, coastline-like polygon"""
+    rng = random.Random(seed)
+    points = []
+    for index in range(vertices):
+        angle = 2 * math.pi * index / vertices
+        distance = radius * rng.uniform(0.7, 1.0)
+        points.append((lon + distance * math.cos(angle), lat + distance * math.sin(angle)))
+    return shapely.Polygon(points)
+
+
+POLYGON = noisy_polygon(10, 45, 2)
+MULTIPOLYGON = shapely.MultiPolygon([noisy_polygon(0, 0, 1, seed=1), noisy_polygon(5, 5, 1, seed=2)])
+
+
+def make_products(count, seed=0):
+    rng = random.Random(seed)
+    products = []
+    for index in range(count):
+        lon, lat = rng.uniform(-2, 13), rng.uniform(-2, 48)
+        products.append(EOProduct('cop_dataspace_opensearch', {
+            'id': f'p{index}', 'title': f'p{index}', 'geometry': shapely.box(lon, lat, lon + 0.3, lat + 0.3).wkt,
+        }))
+    return products
+
+
+@pytest.mark.parametrize('aoi', [POLYGON, MULTIPOLYGON], ids=['polygon', 'multipolygon'])
+@pytest.mark.parametrize('max_wkt_length', [200, 2000])
+def test_server_geometry_covers_aoi_and_fits(aoi, max_wkt_length):
+    assert len(aoi.wkt) > max_wkt_length
+    simplified = server_geometry(aoi, max_wkt_length)
+    assert len(simplified.wkt) <= max_wkt_length
+    assert simplified.covers(aoi)
+
+
+def test_short_geometry_is_sent_as_is():
+    assert server_geometry([0, 0, 1, 1]).equals(shapely.box(0, 0, 1, 1))
+
+
+@pytest.mark.parametrize('aoi', [POLYGON, MULTIPOLYGON], ids=['polygon', 'multipolygon'])
+def test_refine_equals_exact_query(aoi):
+    simplified = server_geometry(aoi, 500)
+    # What the server returns for the simplified geometry, a superset of the exact answer
+    superset = [product for product in make_products(2000) if product.geometry.intersects(simplified)]
+    exact = [product.properties['id'] for product in superset if product.geometry.intersects(aoi)]
+    assert 0 < len(exact) < len(superset)
+
+    kept, discarded = refine(superset, aoi)
+    assert [product.properties['id'] for product in kept] == exact
+    assert discarded == pytest.approx(1 - len(exact) / len(superset))
+
+
+def test_refine_empty_result():
+    kept, discarded = refine([], POLYGON)
+    assert list(kept) == [] and discarded == 0.0
+
+
+def test_search_simplified_sends_compact_geometry():
+    class StubGateway:
+        def search_all(self, geom, **kwargs):
+            self.geom = geom
+            return SearchResult([product for product in make_products(2000) if product.geometry.intersects(geom)])
+
+    dag = StubGateway()
+    products, discarded = search_simplified(dag, MULTIPOLYGON, max_wkt_length=500, productType='S2_MSI_L2A')
+    assert len(dag.geom.wkt) <= 500
+    assert sorted(product.properties['id'] for product in products) == sorted(
+        product.properties['id'] for product in make_products(2000) if product.geometry.intersects(MULTIPOLYGON)
+    )
+    assert 0 < discarded < 1
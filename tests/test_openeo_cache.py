@@ -0,0 +1,57 @@
+"""
+Tests of process graph hashing and of the openEO result cache
+"""
+from eodata_gateway.openeo_cache import OpenEOResultCache, graph_hash
+
+
+def make_graph(load_id='loadcollection1', reduce_id='reducedimension1', end='2020-02-01', output_format='GTiff'):
+    return {
+        load_id: {
+            'process_id': 'load_collection',
+            'arguments': {'id': 'S2', 'temporal_extent': ['2020-01-01', end], 'spatial_extent': None},
+        },
+        reduce_id: {
+            'process_id': 'reduce_dimension',
+            'arguments': {'data': {'from_node': load_id}, 'dimension': 't', 'reducer': {'process_graph': {
+                'mean1': {'process_id': 'mean', 'arguments': {'data': {'from_parameter': 'data'}}, 'result': True},
+            }}},
+        },
+        'saveresult1': {
+            'process_id': 'save_result',
+            'arguments': {'data': {'from_node': reduce_id}, 'format': output_format},
+            'result': True,
+        },
+    }
+
+
+def test_graph_hash_ignores_node_ids():
+    assert graph_hash(make_graph()) == graph_hash(make_graph(load_id='load', reduce_id='reduce'))
+    assert graph_hash(make_graph()) != graph_hash(make_graph(end='2020-03-01'))
+    assert graph_hash(make_graph()) != graph_hash(make_graph(output_format='netCDF'))
+
+
+def test_put_get_materialize(tmp_path):
+    cache = OpenEOResultCache(str(tmp_path / 'cache'))
+    result = tmp_path / 'result.tif'
+    result.write_bytes(b'data')
+
+    assert cache.get(make_graph()) is None
+    cache.put(make_graph(), [str(result)])
+    (cached,) = cache.get(make_graph(load_id='load'))
+    assert open(cached, 'rb').read() == b'data'
+    (copied,) = cache.materialize(make_graph(), str(tmp_path / 'job'))
+    assert copied == str(tmp_path / 'job' / 'result.tif')
+    assert cache.get(make_graph(output_format='netCDF')) is None
+
+
+def test_recent_results_expire(tmp_path):
+    cache = OpenEOResultCache(str(tmp_path / 'cache'), recent_ttl=-1)
+    result = tmp_path / 'result.tif'
+    result.write_bytes(b'data')
+    cache.put(make_graph(end='2999-01-01'), [str(result)])
+    cache.put(make_graph(), [str(result)])
+
+    assert cache.get(make_graph(end='2999-01-01')) is None
+    assert cache.get(make_graph()) is not None
+    assert cache.invalidate(make_graph()) == 1
+    assert cache.get(make_graph()) is None
@@ -0,0 +1,161 @@
+"""
+Tests of the openEO batch job manager against openeo's DummyBackend
+"""
+import json
+
+import pytest
+from openeo.rest._testing import DummyBackend
+
+from eodata_gateway.openeo_cache import OpenEOResultCache
+from eodata_gateway.openeo_jobs import CANCELED, DOWNLOADED, ERROR, QUEUED, SUBMITTED, OpenEOJobManager
+
+ROOT_URL = 'https://openeo.test/'
+
+
+class Crash(BaseException):
+    """Process crash, not caught by the manager"""
+
+
+def make_graph(collection='S2', bands=('B04',)):
+    return {
+        'load1': {
+            'process_id': 'load_collection',
+            'arguments': {'id': collection, 'spatial_extent': None, 'temporal_extent': None, 'bands': list(bands)},
+            'result': True,
+        }
+    }
+
+
+@pytest.fixture
+def backend(requests_mock):
+    return DummyBackend.at_url(ROOT_URL, requests_mock=requests_mock)
+
+
+@pytest.fixture
+def make_manager(backend, tmp_path):
+    def make_manager(**kwargs):
+        return OpenEOJobManager(
+            backend.connection, str(tmp_path / 'jobs.json'), output_dir=str(tmp_path / 'results'),
+            poll_interval=0, max_poll_interval=0, **kwargs
+        )
+    return make_manager
+
+
+def test_run_submits_polls_and_downloads(backend, make_manager):
+    manager = make_manager(max_concurrent=1)
+    manager.add_job('red', make_graph(bands=('B04',)))
+    manager.add_job('nir', make_graph(bands=('B08',)))
+
+    assert manager.run() == {'red': DOWNLOADED, 'nir': DOWNLOADED}
+    assert len(backend.batch_jobs) == 2
+    for name in ('red', 'nir'):
+        path = next(path for path in manager.jobs[name]['results'] if path.endswith('result.data'))
+        with open(path, 'rb') as f:
+            assert f.read() == DummyBackend.DEFAULT_RESULT
+
+
+def test_run_backs_off_until_finished(backend, make_manager):
+    polls = []
+
+    def status_updater(job_id, current_status):
+        polls.append(job_id)
+        return 'finished' if len(polls) > 3 else 'running'
+
+    backend.job_status_updater = status_updater
+    manager = make_manager()
+    manager.add_job('red', make_graph())
+
+    assert manager.run() == {'red': DOWNLOADED}
+    assert manager.jobs['red']['backend_status'] == 'finished'
+
+
+def test_backend_error_and_cancel(backend, make_manager):
+    manager = make_manager()
+    manager.add_job('failing', make_graph(bands=('B04',)))
+    manager.add_job('canceled', make_graph(bands=('B08',)))
+    backend.job_status_updater = lambda job_id, current_status: {'job-000': 'error', 'job-001': 'canceled'}[job_id]
+
+    assert manager.run() == {'failing': ERROR, 'canceled': CANCELED}
+
+
+def test_transient_status_error_keeps_running(backend, make_manager, requests_mock):
+    manager = make_manager()
+    manager.add_job('red', make_graph())
+    manager._submit_queued()
+    requests_mock.get(f'{ROOT_URL}jobs/job-000', status_code=502)
+
+    assert manager._poll_statuses() == {'red': 'created'}
+    assert manager.jobs['red']['status'] == SUBMITTED
+
+
+def test_resume_does_not_resubmit(backend, make_manager):
+    backend.job_status_updater = lambda job_id, current_status: 'running'
+    manager = make_manager()
+    manager.add_job('red', make_graph())
+    manager._submit_queued()
+    assert len(backend.batch_jobs) == 1
+
+    backend.job_status_updater = lambda job_id, current_status: 'finished'
+    resumed = make_manager()
+    assert resumed.jobs['red']['status'] == SUBMITTED
+    assert resumed.run() == {'red': DOWNLOADED}
+    assert len(backend.batch_jobs) == 1
+
+
+def test_resume_starts_created_job(backend, make_manager, monkeypatch):
+    manager = make_manager()
+    manager.add_job('red', make_graph())
+    # Simulate a crash between job creation and start
+    monkeypatch.setattr(backend.connection, 'job', lambda job_id: (_ for _ in ()).throw(Crash()))
+    with pytest.raises(Crash):
+        manager._submit_queued()
+    monkeypatch.undo()
+    assert backend.batch_jobs['job-000']['status'] == 'created'
+
+    resumed = make_manager()
+    assert resumed.jobs['red']['started'] is False
+    assert resumed.run() == {'red': DOWNLOADED}
+    assert len(backend.batch_jobs) == 1
+
+
+def test_duplicate_graphs_share_results(backend, make_manager):
+    manager = make_manager()
+    manager.add_job('first', make_graph())
+    manager.add_job('second', make_graph())
+    assert manager.jobs['second']['duplicate_of'] == 'first'
+
+    assert manager.run() == {'first': DOWNLOADED, 'second': DOWNLOADED}
+    assert len(backend.batch_jobs) == 1
+    assert manager.jobs['second']['results']
+    assert all('/second/' in path for path in manager.jobs['second']['results'])
+
+
+def test_duplicate_of_failed_job_is_submitted(backend, make_manager):
+    manager = make_manager()
+    manager.add_job('first', make_graph())
+    manager.add_job('second', make_graph())
+    backend.job_status_updater = lambda job_id, current_status: 'error' if job_id == 'job-000' else 'finished'
+
+    assert manager.run() == {'first': ERROR, 'second': DOWNLOADED}
+    assert len(backend.batch_jobs) == 2
+
+
+def test_cached_results_skip_backend(backend, make_manager, tmp_path):
+    cache = OpenEOResultCache(str(tmp_path / 'cache'))
+    manager = make_manager(cache=cache)
+    manager.add_job('first', make_graph())
+    manager.run()
+
+    again = OpenEOJobManager(
+        backend.connection, str(tmp_path / 'other.json'), output_dir=str(tmp_path / 'other'), cache=cache
+    )
+    again.add_job('again', make_graph())
+    assert again.jobs['again']['status'] == DOWNLOADED
+    assert len(backend.batch_jobs) == 1
+
+
+def test_state_file_is_json(make_manager, tmp_path):
+    manager = make_manager()
+    manager.add_job('red', make_graph())
+    with open(tmp_path / 'jobs.json') as f:
+        assert json.load(f)['red']['status'] == QUEUED
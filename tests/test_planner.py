@@ -0,0 +1,163 @@
+"""
+Tests of box arithmetic and of the local-first query planner
+"""
+import random
+import sqlite3
+import time
+
+import pytest
+from eodag.api.product import EOProduct
+from eodag.api.search_result import SearchResult
+
+from eodata_gateway import planner
+from eodata_gateway.planner import QueryPlanner, merge_pieces, remainder, subtract_box
+
+QUERY = (0, 0, 0, 10, 10, 10)
+
+
+def volume(box):
+    return (box[3] - box[0]) * (box[4] - box[1]) * (box[5] - box[2])
+
+
+def contains_point(boxes, point):
+    return any(all(box[d] <= point[d] < box[d + 3] for d in range(3)) for box in boxes)
+
+
+def grid_points():
+    return [(x + 0.5, y + 0.5, t + 0.5) for x in range(10) for y in range(10) for t in range(10)]
+
+
+def test_subtract_disjoint_box():
+    assert subtract_box(QUERY, (20, 20, 20, 30, 30, 30)) == [QUERY]
+
+
+def test_subtract_containing_box():
+    assert subtract_box(QUERY, (-1, -1, -1, 11, 11, 11)) == []
+
+
+def test_subtract_partial_box():
+    cover = (2, 2, 2, 5, 5, 5)
+    pieces = subtract_box(QUERY, cover)
+    assert len(pieces) == 6
+    assert sum(volume(piece) for piece in pieces) == volume(QUERY) - volume(cover)
+    for point in grid_points():
+        assert contains_point(pieces, point) != contains_point([cover], point)
+
+
+def test_remainder_without_and_with_full_coverage():
+    assert remainder(QUERY, []) == [QUERY]
+    assert remainder(QUERY, [(0, 0, 0, 5, 10, 10), (5, 0, 0, 10, 10, 10)]) == []
+
+
+def test_remainder_of_overlapping_covers_stays_small():
+    covers = [(2, 2, 1, 7, 7, 6), (5, 4, 3, 9, 8, 8)]
+    exact = remainder(QUERY, covers, max_pieces=100)
+    assert len(exact) > 8
+    merged = remainder(QUERY, covers, max_pieces=8)
+    assert len(merged) <= 8
+    fetched = [point for point in grid_points() if contains_point(merged, point)]
+    uncovered = [point for point in grid_points() if not contains_point(covers, point)]
+    # Every gap is fetched, without falling back to the whole query
+    assert set(uncovered) <= set(fetched)
+    assert len(fetched) < len(grid_points())
+
+
+def test_merge_adjacent_pieces_exactly():
+    pieces = [(0, 0, 0, 1, 10, 10), (1, 0, 0, 2, 10, 10), (5, 0, 0, 6, 10, 10)]
+    assert sorted(merge_pieces(pieces, 2)) == [(0, 0, 0, 2, 10, 10), (5, 0, 0, 6, 10, 10)]
+
+
+def test_remainder_of_many_overlapping_covers_is_fast():
+    rng = random.Random(30)
+    covers = []
+    for _ in range(30):
+        lower = [rng.uniform(-2, 9) for _ in range(3)]
+        covers.append(tuple(lower) + tuple(value + rng.uniform(1, 6) for value in lower))
+    begin = time.perf_counter()
+    pieces = remainder(QUERY, covers)
+    assert time.perf_counter() - begin < 2
+    assert len(pieces) <= 8
+    uncovered = [point for point in grid_points() if not contains_point(covers, point)]
+    assert all(contains_point(pieces, point) for point in uncovered)
+
+
+def make_product(uid, lon, date, end=None):
+    return EOProduct('cop_dataspace_opensearch', {
+        'id': uid, 'title': uid, 'geometry': f'POLYGON (({lon} 0, {lon + 1} 0, {lon + 1} 1, {lon} 1, {lon} 0))',
+        'startTimeFromAscendingNode': date, 'completionTimeFromAscendingNode': end or date,
+    }, productType='S2_MSI_L2A')
+
+
+class StubGateway:
+    """Gateway stub serving a mutable catalogue, filtering on acquisition start like resto"""
+
+    def __init__(self, products):
+        self.products = products
+        self.searches = []
+
+    def search_all(self, productType, start, end, geom, **kwargs):
+        self.searches.append(geom)
+        lonmin, _, lonmax, _ = geom
+        return SearchResult([
+            product for product in self.products
+            if product.geometry.bounds[0] <= lonmax and product.geometry.bounds[2] >= lonmin
+            and planner._timestamp(start) <= planner._timestamp(product.properties['startTimeFromAscendingNode'])
+            <= planner._timestamp(end)
+        ])
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(planner, 'register_product', lambda dag, product: product)
+    dag = StubGateway([make_product('a', 0, '2020-01-02'), make_product('b', 5, '2020-01-02')])
+    return dag, QueryPlanner(dag, str(tmp_path / 'planner.db'))
+
+
+def titles(results):
+    return sorted(product.properties['title'] for product in results)
+
+
+def test_search_answers_covered_queries_locally(store):
+    dag, query_planner = store
+    assert titles(query_planner.search('S2_MSI_L2A', '2020-01-01', '2020-01-10', [0, 0, 10, 1])) == ['a', 'b']
+    assert titles(query_planner.search('S2_MSI_L2A', '2020-01-01', '2020-01-10', [4, 0, 8, 1])) == ['b']
+    assert len(dag.searches) == 1
+
+
+def test_refetch_and_prune_drop_removed_products(store):
+    dag, query_planner = store
+    query_planner.search('S2_MSI_L2A', '2020-01-01', '2020-01-10', [0, 0, 10, 1])
+    dag.products = dag.products[:1]
+    query_planner.max_age = -1
+    results = query_planner.search('S2_MSI_L2A', '2020-01-01', '2020-01-10', [0, 0, 10, 1])
+    assert titles(results) == ['a']
+
+    assert query_planner.prune() == (2, 1)
+
+
+def test_overlapping_searches_compact_coverage(store):
+    dag, query_planner = store
+    for lonmin in range(0, 8):
+        query_planner.search('S2_MSI_L2A', '2020-01-01', '2020-01-10', [lonmin, 0, lonmin + 2.5, 1])
+    query_planner.search('S2_MSI_L2A', '2020-01-01', '2020-01-10', [0, 0, 10, 1])
+    with sqlite3.connect(query_planner.path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM coverage').fetchone() == (1,)
+    assert titles(query_planner.search('S2_MSI_L2A', '2020-01-02', '2020-01-05', [1, 0, 9, 1])) == ['a', 'b']
+    assert len(dag.searches) == 9
+
+
+def test_time_windows_match_on_acquisition_start(store):
+    dag, query_planner = store
+    dag.products.append(make_product('early', 0, '2019-12-31', end='2020-01-02'))
+    assert titles(query_planner.search('S2_MSI_L2A', '2019-12-20', '2020-01-10', [0, 0, 10, 1])) == [
+        'a', 'b', 'early'
+    ]
+    # Locally answered like the catalogue would, without the product acquired before the window
+    assert titles(query_planner.search('S2_MSI_L2A', '2020-01-01', '2020-01-10', [0, 0, 10, 1])) == ['a', 'b']
+    assert len(dag.searches) == 1
+
+    # Refetching the later window must not drop the product as removed from the catalogue
+    query_planner.max_age = -1
+    query_planner.search('S2_MSI_L2A', '2020-01-01', '2020-01-10', [0, 0, 10, 1])
+    with sqlite3.connect(query_planner.path) as conn:
+        assert sorted(uid for (uid,) in conn.execute('SELECT uid FROM products')) == ['a', 'b', 'early']
@@ -0,0 +1,62 @@
+"""
+Tests of quicklook prefetching and cache eviction
+"""
+import os
+import time
+
+from eodag.api.product import EOProduct
+
+from eodata_gateway.quicklooks import QuicklookCache, prefetch_quicklooks
+
+
+def make_products(count):
+    return [
+        EOProduct('cop_dataspace_opensearch', {
+            'id': f'p{index}', 'title': f'p{index}', 'geometry': 'POINT (0 0)',
+            'quicklook': f'https://quicklooks.test/p{index}.jpg',
+        })
+        for index in range(count)
+    ]
+
+
+def test_prefetch_uses_cache(requests_mock, tmp_path):
+    requests_mock.get('https://quicklooks.test/p0.jpg', content=b'image')
+    cache = QuicklookCache(str(tmp_path), max_bytes=1000)
+    (product,) = make_products(1)
+
+    for _ in range(2):
+        result = prefetch_quicklooks([product], cache=cache)
+        with open(result['p0']['quicklook'], 'rb') as f:
+            assert f.read() == b'image'
+    assert requests_mock.call_count == 1
+
+
+def test_cache_stays_bounded_across_batches(requests_mock, tmp_path):
+    products = make_products(10)
+    for product in products:
+        requests_mock.get(product.properties['quicklook'], content=b'x' * 100)
+    cache = QuicklookCache(str(tmp_path), max_bytes=350)
+
+    for index, product in enumerate(products):
+        prefetch_quicklooks([product], cache=cache)
+        time.sleep(0.01)
+        sizes = [os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(tmp_path) for name in names]
+        assert sum(sizes) <= 350
+    # The most recently used images are kept
+    assert cache.get('p9') and cache.get('p7') and not cache.get('p0')
+
+
+def test_batch_larger_than_cache_keeps_returned_paths(requests_mock, tmp_path):
+    products = make_products(5)
+    for product in products:
+        requests_mock.get(product.properties['quicklook'], content=b'x' * 100)
+    cache = QuicklookCache(str(tmp_path), max_bytes=250)
+    cache.put('old', b'x' * 100)
+
+    results = prefetch_quicklooks(products, cache=cache, max_workers=2)
+    assert all(os.path.exists(result['quicklook']) for result in results.values())
+    assert not cache.get('old')
+
+    # The next batch may evict the previous one
+    prefetch_quicklooks(make_products(1), cache=cache)
+    assert cache.evict() == 0
@@ -0,0 +1,99 @@
+"""
+Tests of the provider router with a stub gateway
+"""
+import threading
+import time
+
+import pytest
+from eodag.api.product import EOProduct
+from eodag.api.search_result import SearchResult
+
+from eodata_gateway.routing import ProviderRouter, deduplicate
+
+
+def make_product(provider, title):
+    return EOProduct(provider, {'id': f'{provider}-{title}', 'title': title, 'geometry': 'POINT (0 0)'})
+
+
+class StubGateway:
+    """Gateway stub with a latency and failure switch per provider"""
+
+    def __init__(self, delays, failing=()):
+        self.delays = delays
+        self.failing = set(failing)
+        self.calls = []
+        self.running = {}
+        self.overlaps = 0
+        self.lock = threading.Lock()
+
+    def search(self, provider, productType, raise_errors, **kwargs):
+        with self.lock:
+            self.calls.append(provider)
+            if self.running.get(provider):
+                self.overlaps += 1
+            self.running[provider] = True
+        try:
+            time.sleep(self.delays[provider])
+            if provider in self.failing:
+                raise RuntimeError(f'{provider} is down')
+            return SearchResult([make_product(provider, 'a'), make_product(provider, 'a'), make_product(provider, 'b')])
+        finally:
+            with self.lock:
+                self.running[provider] = False
+
+
+def test_deduplicate_on_title():
+    products = deduplicate([make_product('p1', 'a'), make_product('p2', 'a'), make_product('p2', 'b')])
+    assert [product.provider for product in products] == ['p1', 'p2']
+
+
+def test_failover_and_cooldown():
+    dag = StubGateway({'fast': 0, 'slow': 0}, failing={'fast'})
+    with ProviderRouter(dag, providers=['fast', 'slow'], max_consecutive_errors=2, cooldown=60) as router:
+        for _ in range(2):
+            assert len(router.search('S2_MSI_L2A')) == 2
+        assert router.ranked_providers('S2_MSI_L2A') == ['slow', 'fast']
+        assert not router.report()[('fast', 'S2_MSI_L2A')]['healthy']
+
+
+def test_single_error_does_not_trip_cooldown():
+    dag = StubGateway({'fast': 0, 'slow': 0.01}, failing={'fast'})
+    with ProviderRouter(dag, providers=['fast', 'slow']) as router:
+        router.stats[('slow', 'S2_MSI_L2A')].record(0.01, True)
+        assert len(router.search('S2_MSI_L2A')) == 2
+        assert dag.calls == ['fast', 'slow']
+        assert router.report()[('fast', 'S2_MSI_L2A')]['healthy']
+
+        dag.failing.clear()
+        router.search('S2_MSI_L2A')
+        assert dag.calls[-1] == 'fast'
+
+
+def test_error_rate_trips_cooldown_after_min_samples():
+    dag = StubGateway({'flaky': 0, 'other': 0})
+    with ProviderRouter(dag, providers=['flaky', 'other'], min_samples=4) as router:
+        stats = router.stats[('flaky', 'S2_MSI_L2A')]
+        for ok in (False, True, False):
+            stats.record(0.01, ok)
+        assert router.report()[('flaky', 'S2_MSI_L2A')]['healthy']
+        stats.record(0.01, False)
+        assert not router.report()[('flaky', 'S2_MSI_L2A')]['healthy']
+
+
+def test_all_providers_failing_raises():
+    dag = StubGateway({'p1': 0, 'p2': 0}, failing={'p1', 'p2'})
+    with ProviderRouter(dag, providers=['p1', 'p2']) as router:
+        with pytest.raises(RuntimeError):
+            router.search('S2_MSI_L2A')
+
+
+def test_race_losers_never_overlap_later_searches():
+    dag = StubGateway({'fast': 0.01, 'slow': 0.3})
+    with ProviderRouter(dag, providers=['fast', 'slow'], race=True) as router:
+        router.stats[('slow', 'S2_MSI_L2A')].record(0.001, True)
+        router.stats[('fast', 'S2_MSI_L2A')].record(0.002, True)
+        for _ in range(3):
+            assert router.search('S2_MSI_L2A')[0].provider == 'fast'
+            # The slow racer is still running: the next search prefers the idle provider
+            assert router.search('S2_MSI_L2A', race=False)[0].provider == 'fast'
+    assert dag.overlaps == 0